@@ -205,13 +205,23 @@ GEONAMES_REGION_INFO_URL = (
 GEONAMES_CITIES_URL_TEMPLATE = (
     "https://raw.githubusercontent.com/ali-hv/geobank-data/refs/heads/main/cities{population}.zip"
 )
+# Population thresholds geonames publishes a cities file for, smallest first
+GEONAMES_CITIES_THRESHOLDS = (500, 1000, 5000, 15000)
 
 # Geobank Translations URL
 GEOBANK_TRANSLATIONS_URL = (
     "https://raw.githubusercontent.com/ali-hv/geobank-data/refs/heads/main/translations.zip"
 )
 
-# RestCountries URLs
-RESTCOUNTRIES_LANGUAGES_URL = "https://restcountries.com/v3.1/all?fields=languages"
-RESTCOUNTRIES_CURRENCIES_URL = "https://restcountries.com/v3.1/all?fields=currencies"
-RESTCOUNTRIES_FLAGS_URL = "https://restcountries.com/v3.1/all?fields=cca2,flags"
+# RestCountries URL, with every field the languages, currencies and flags stages need
+RESTCOUNTRIES_URL = "https://restcountries.com/v3.1/all?fields=cca2,languages,currencies,flags"
+
+# Data sources used by a population run: name -> (upstream URL, file name in a local mirror).
+# The cities source is a template, formatted with the population threshold.
+DATA_SOURCES = {
+    "restcountries": (RESTCOUNTRIES_URL, "restcountries.json"),
+    "countries": (GEONAMES_COUNTRY_INFO_URL, "countryInfo.tsv"),
+    "regions": (GEONAMES_REGION_INFO_URL, "regionInfo.tsv"),
+    "cities": (GEONAMES_CITIES_URL_TEMPLATE, "cities{population}.zip"),
+    "translations": (GEOBANK_TRANSLATIONS_URL, "translations.zip"),
+}
@@ -1,21 +1,700 @@
+import asyncio
+import hashlib
+import http.client
+import json
 import logging
+import os
+import shutil
 import socket
+import tempfile
+import threading
 import time
 import urllib.request
-from urllib.error import URLError
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
+# Responses are copied to disk in chunks of this size instead of being read whole.
+CHUNK_SIZE = 1024 * 1024
+
+# Uncached downloads stay in memory up to this size before spilling to a temp file.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Upper bound on concurrent connections opened by ``prefetch``.
+PREFETCH_MAX_WORKERS = 4
+
+# Files downloaded ahead of time by ``prefetch``, keyed by URL.
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+
+# SHA-256 of the content of every URL downloaded by this process, keyed by URL.
+_content_hashes = {}
+_content_hashes_lock = threading.Lock()
+
+# Errors after which a download is attempted again.
+RETRYABLE_ERRORS = (URLError, socket.timeout, ConnectionError, http.client.HTTPException)
+
+# Redirects followed by the pooled HTTP client before giving up.
+MAX_REDIRECTS = 5
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
 def download_with_retry(url, timeout=10, retries=5):
-    for attempt in range(retries):
+    """
+    Download a URL, retrying on network errors, and return its content as bytes.
+
+    Large archives should be fetched with ``download_to_file`` instead, which
+    never holds the whole response in memory.
+    """
+    content_file = download_to_file(url, timeout=timeout, retries=retries)
+    if content_file is None:
+        return None
+    with content_file:
+        return content_file.read()
+
+
+def download_to_file(url, timeout=10, retries=5):
+    """
+    Download a URL, retrying on network errors, and return a seekable binary file.
+
+    The response is streamed in ``CHUNK_SIZE`` chunks, so peak memory does not
+    grow with the size of the download. The caller is responsible for closing the
+    returned file.
+
+    When a transfer breaks off, the bytes received so far are kept and the next
+    attempt asks only for the rest with an HTTP ``Range`` request. The finished
+    file is checked against the size announced by the server before it is used.
+
+    When ``settings.GEOBANK_CACHE_DIR`` is set, every response is stored on disk
+    together with its ``ETag``/``Last-Modified`` validators, and the next download
+    of the same URL is a conditional GET. A ``304 Not Modified`` answer is served
+    from the cached copy without transferring the body again. Interrupted
+    downloads are kept in the cache as well and resumed by the next run.
+
+    Inside a ``prefetch`` block, a URL that was already fetched is returned
+    immediately without touching the network. ``file://`` URLs are opened in
+    place.
+    """
+    content_file = _open_without_download(url)
+    if content_file is not None:
+        return content_file
+
+    download = _Download(url, timeout)
+    try:
+        for attempt in range(retries):
+            try:
+                logger.info(f"Downloading {url} (Attempt {attempt + 1}/{retries})")
+                return download.attempt()
+            except RETRYABLE_ERRORS as e:
+                logger.warning(f"Download failed: {e}. Retrying in 2 seconds...")
+                if attempt == retries - 1:
+                    raise
+                time.sleep(2)
+    except BaseException:
+        download.close()
+        raise
+    download.close()
+    return None
+
+
+async def adownload_with_retry(url, timeout=10, retries=5, backoff=1):
+    """
+    Asynchronous version of ``download_with_retry``.
+
+    See ``adownload_to_file`` for how retries are scheduled.
+    """
+    content_file = await adownload_to_file(url, timeout=timeout, retries=retries, backoff=backoff)
+    if content_file is None:
+        return None
+    with content_file:
+        return await asyncio.get_running_loop().run_in_executor(None, content_file.read)
+
+
+async def adownload_to_file(url, timeout=10, retries=5, backoff=1):
+    """
+    Asynchronous version of ``download_to_file``.
+
+    Each attempt runs in the event loop's default executor, while waiting
+    between attempts is done with ``asyncio.sleep`` and an exponential backoff
+    (``backoff``, ``2 * backoff``, ``4 * backoff``... seconds), so no thread is
+    held while a retry is pending. Caching, resuming and prefetching behave
+    exactly as in ``download_to_file``.
+    """
+    content_file = _open_without_download(url)
+    if content_file is not None:
+        return content_file
+
+    loop = asyncio.get_running_loop()
+    download = _Download(url, timeout)
+    try:
+        for attempt in range(retries):
+            try:
+                logger.info(f"Downloading {url} (Attempt {attempt + 1}/{retries})")
+                return await loop.run_in_executor(None, download.attempt)
+            except RETRYABLE_ERRORS as e:
+                delay = backoff * 2**attempt
+                logger.warning(f"Download failed: {e}. Retrying in {delay} seconds...")
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+    except BaseException:
+        download.close()
+        raise
+    download.close()
+    return None
+
+
+def _open_without_download(url):
+    """Return a prefetched or local file for a URL, or None if it has to be downloaded."""
+    with _prefetched_lock:
+        content_file = _prefetched.pop(url, None)
+    if content_file is not None:
+        logger.info(f"Using prefetched {url}")
+        return content_file
+
+    parts = urlsplit(url)
+    if parts.scheme == "file":
+        # Local mirrors are read in place, without copying or caching
+        return open(urllib.request.url2pathname(parts.path), "rb")
+
+    return None
+
+
+class _Download:
+    """State of one download that is kept between its retry attempts."""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.cache_paths = _get_cache_paths(url)
+        self.cache_meta = (
+            _read_json(self.cache_paths[1])
+            if self.cache_paths and self.cache_paths[0].exists()
+            else None
+        )
+        self.validators = _get_cache_validators(self.cache_meta)
+        self.partial_file, self.resume_info = _open_partial(self.cache_paths)
+
+    def attempt(self):
+        """Make one request and return the finished file, or raise one of ``RETRYABLE_ERRORS``."""
+        url = self.url
+        offset = self.partial_file.seek(0, os.SEEK_END)
+        try:
+            headers = _get_resume_headers(offset, self.resume_info) if offset else self.validators
+            request = urllib.request.Request(url, headers=headers)
+            with _urlopen(request, timeout=self.timeout) as response:
+                if offset and response.status == 206:
+                    _check_content_range(response, offset)
+                    logger.info(f"Resuming {url} from byte {offset}")
+                else:
+                    self.partial_file.seek(0)
+                    self.partial_file.truncate()
+                    self.resume_info = _get_resume_info(response)
+                    _write_partial_meta(self.cache_paths, self.resume_info)
+                shutil.copyfileobj(response, self.partial_file, CHUNK_SIZE)
+            _check_size(self.partial_file, self.resume_info)
+            return _finish_download(self.cache_paths, url, self.partial_file, self.resume_info)
+        except HTTPError as e:
+            if e.code == 304 and not offset and self.validators:
+                if _is_cache_intact(self.cache_paths, self.cache_meta):
+                    logger.info(f"{url} not modified, using cached copy")
+                    return self._open_cached()
+                logger.warning(f"Cached copy of {url} is damaged, downloading it again")
+                self.validators = {}
+                return self.attempt()
+            if e.code == 416:
+                # The server cannot serve the requested range, so start over
+                self.partial_file.truncate(0)
+            raise
+
+    def close(self):
+        self.partial_file.close()
+
+    def _open_cached(self):
+        self.close()
+        _get_partial_paths(self.cache_paths)[0].unlink(missing_ok=True)
+        content_file = open(self.cache_paths[0], "rb")  # noqa: SIM115
+        _record_content_hash(self.url, self.cache_meta.get("sha256") or _file_sha256(content_file))
+        content_file.seek(0)
+        return content_file
+
+
+class ConnectionPool:
+    """
+    A minimal HTTP client that keeps connections alive between requests.
+
+    ``urllib.request.urlopen`` opens a new connection, and for HTTPS a new TLS
+    session, for every request. The pool instead keeps idle connections per
+    scheme, host and port and hands them to the next request for the same host.
+    Connections are checked out exclusively, so the pool can be shared by the
+    ``prefetch`` worker threads.
+    """
+
+    def __init__(self):
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def urlopen(self, request, timeout):
+        """
+        Send a GET request and return the response.
+
+        Error statuses raise ``HTTPError`` and connection errors raise ``URLError``,
+        like ``urllib.request.urlopen``.
+        """
+        url = request.full_url
+        headers = dict(request.header_items())
+        headers.setdefault("User-Agent", "GeoBank")
+
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            key = (parts.scheme, parts.hostname, parts.port)
+            path = parts.path or "/"
+            if parts.query:
+                path = f"{path}?{parts.query}"
+
+            try:
+                response, connection = self._send(key, path, headers, timeout)
+            except OSError as e:
+                # http.client raises DNS, socket and TLS errors as they are;
+                # urllib's do_open wraps them in URLError, so callers retry them
+                raise URLError(e) from e
+            if response.status in REDIRECT_STATUSES and response.getheader("Location"):
+                response.read()
+                self._release(key, connection, response)
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            if not 200 <= response.status < 300:
+                response.read()
+                self._release(key, connection, response)
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+            return _PooledResponse(self, key, connection, response)
+
+        raise HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+    def close(self):
+        """Close every idle connection and log how often connections were reused."""
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+            opened, reused = self.opened, self.reused
+            self.opened = self.reused = 0
+        for connection in connections:
+            connection.close()
+        if opened:
+            logger.info(f"HTTP connections: {opened} opened, {reused} reused")
+
+    def _send(self, key, path, headers, timeout):
+        """Send a request, retrying once on a fresh connection if a kept-alive one went stale."""
+        connection, reused = self._acquire(key, timeout)
         try:
-            logger.info(f"Downloading {url} (Attempt {attempt + 1}/{retries})")
-            with urllib.request.urlopen(url, timeout=timeout) as response:  # nosec
-                return response.read()
-        except (URLError, socket.timeout) as e:
-            logger.warning(f"Download failed: {e}. Retrying in 2 seconds...")
-            if attempt == retries - 1:
+            connection.request("GET", path, headers=headers)
+            return connection.getresponse(), connection
+        except (ConnectionError, http.client.HTTPException):
+            connection.close()
+            if not reused:
                 raise
-            time.sleep(2)
-    return None
+
+        connection, _ = self._acquire(key, timeout, reuse=False)
+        try:
+            connection.request("GET", path, headers=headers)
+            return connection.getresponse(), connection
+        except BaseException:
+            connection.close()
+            raise
+
+    def _acquire(self, key, timeout, reuse=True):
+        with self._lock:
+            if reuse and self._idle[key]:
+                connection = self._idle[key].pop()
+                self.reused += 1
+            else:
+                connection = None
+                self.opened += 1
+
+        if connection is not None:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return connection, True
+
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _release(self, key, connection, response):
+        """Return a connection to the pool if its last response was read to the end."""
+        if response.isclosed() and not response.will_close:
+            with self._lock:
+                self._idle[key].append(connection)
+        else:
+            connection.close()
+
+
+class _PooledResponse:
+    """File-like response that returns its connection to the pool when closed."""
+
+    def __init__(self, pool, key, connection, response):
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self._response.read(amt)
+
+    def close(self):
+        if self._connection is not None:
+            self._pool._release(self._key, self._connection, self._response)
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Shared by every download of a populate run, and emptied by ``close_connections``.
+_connection_pool = ConnectionPool()
+
+
+def close_connections():
+    """Close the connections kept alive between downloads and log reuse statistics."""
+    _connection_pool.close()
+
+
+def _urlopen(request, timeout):
+    """
+    Open a request, over a pooled keep-alive connection when possible.
+
+    Other schemes (such as ``file://``) and proxied requests go through
+    ``urllib.request.urlopen``, which already knows how to handle them.
+    """
+    scheme = urlsplit(request.full_url).scheme
+    if scheme in ("http", "https") and scheme not in urllib.request.getproxies():
+        return _connection_pool.urlopen(request, timeout)
+    return urllib.request.urlopen(request, timeout=timeout)  # nosec
+
+
+def get_content_hash(url):
+    """
+    Return the SHA-256 hex digest of a URL's content, or None if it is not known.
+
+    Hashes are recorded as downloads complete, including answers served from the
+    cache, so after a ``prefetch`` every successfully fetched source has one.
+    ``file://`` URLs are hashed from the local file on every call, since the
+    file may change between runs of a long-lived worker.
+    """
+    with _content_hashes_lock:
+        sha256 = _content_hashes.get(url)
+    if sha256 is not None:
+        return sha256
+
+    parts = urlsplit(url)
+    if parts.scheme != "file":
+        return None
+    try:
+        with open(urllib.request.url2pathname(parts.path), "rb") as f:
+            sha256 = _file_sha256(f)
+    except OSError:
+        return None
+    return sha256
+
+
+def is_available_locally(url):
+    """
+    Check whether a URL can be read without a network request.
+
+    Args:
+        url: The URL to check.
+
+    Returns:
+        bool: True for an existing ``file://`` path or a URL with a body in the
+        download cache.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == "file":
+        return Path(urllib.request.url2pathname(parts.path)).exists()
+
+    cache_paths = _get_cache_paths(url)
+    return cache_paths is not None and all(path.exists() for path in cache_paths)
+
+
+def _record_content_hash(url, sha256):
+    with _content_hashes_lock:
+        _content_hashes[url] = sha256
+
+
+def _forget_content_hashes(urls):
+    """
+    Drop the recorded hashes of ``urls`` at the start of a run.
+
+    Otherwise, in a long-lived worker, a source that fails to download would
+    still report the hash of an earlier run. URLs already prefetched by an
+    enclosing ``aprefetch`` keep the hash recorded for them.
+    """
+    with _prefetched_lock:
+        pending = [url for url in urls if url not in _prefetched]
+    with _content_hashes_lock:
+        for url in pending:
+            _content_hashes.pop(url, None)
+
+
+@contextmanager
+def prefetch(urls, max_workers=PREFETCH_MAX_WORKERS, timeout=10, retries=5):
+    """
+    Download several URLs concurrently before they are needed.
+
+    Within the ``with`` block, ``download_to_file`` and ``download_with_retry``
+    return the prefetched content instead of downloading it again, so network
+    latency is paid once, in parallel, rather than once per population stage.
+    A URL that fails to prefetch is logged and downloaded on demand later.
+    Prefetched files that were never used are closed when the block exits.
+    """
+    urls = list(dict.fromkeys(urls))
+    logger.info(f"Prefetching {len(urls)} sources with up to {max_workers} workers...")
+    _forget_content_hashes(urls)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(download_to_file, url, timeout, retries): url for url in urls
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    content_file = future.result()
+                except Exception as e:
+                    logger.warning(
+                        f"Prefetch of {url} failed: {e}. It will be downloaded on demand."
+                    )
+                    continue
+                if content_file is not None:
+                    with _prefetched_lock:
+                        _prefetched[url] = content_file
+        yield
+    finally:
+        with _prefetched_lock:
+            unused = list(_prefetched.values())
+            _prefetched.clear()
+        for content_file in unused:
+            content_file.close()
+
+
+@asynccontextmanager
+async def aprefetch(urls, max_workers=PREFETCH_MAX_WORKERS, timeout=10, retries=5, backoff=1):
+    """
+    Asynchronous version of ``prefetch``.
+
+    At most ``max_workers`` downloads run at once. Within the ``async with``
+    block, ``download_to_file`` and ``adownload_to_file`` (and so the parsers)
+    return the prefetched content.
+    """
+    urls = list(dict.fromkeys(urls))
+    logger.info(f"Prefetching {len(urls)} sources with up to {max_workers} workers...")
+    _forget_content_hashes(urls)
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def fetch(url):
+        async with semaphore:
+            try:
+                content_file = await adownload_to_file(url, timeout, retries, backoff)
+            except Exception as e:
+                logger.warning(f"Prefetch of {url} failed: {e}. It will be downloaded on demand.")
+                return
+        if content_file is not None:
+            with _prefetched_lock:
+                _prefetched[url] = content_file
+
+    try:
+        await asyncio.gather(*(fetch(url) for url in urls))
+        yield
+    finally:
+        with _prefetched_lock:
+            unused = list(_prefetched.values())
+            _prefetched.clear()
+        for content_file in unused:
+            content_file.close()
+
+
+def _get_cache_paths(url):
+    """Return the (body, metadata) cache paths for a URL, or None if caching is disabled."""
+    cache_dir = getattr(settings, "GEOBANK_CACHE_DIR", None)
+    if not cache_dir:
+        return None
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return cache_dir / key, cache_dir / f"{key}.json"
+
+
+def _read_json(path):
+    """Read a small JSON metadata file, returning None if it is missing or unreadable."""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable cache metadata {path}: {e}")
+        return None
+
+
+def _write_json(path, data):
+    """Atomically write a small JSON metadata file."""
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _get_cache_validators(cache_meta):
+    """Build conditional request headers from a cached response, if there is one."""
+    if not cache_meta:
+        return {}
+
+    headers = {}
+    if cache_meta.get("etag"):
+        headers["If-None-Match"] = cache_meta["etag"]
+    if cache_meta.get("last_modified"):
+        headers["If-Modified-Since"] = cache_meta["last_modified"]
+    return headers
+
+
+def _is_cache_intact(cache_paths, cache_meta):
+    """Check a cached body against the size and checksum recorded when it was stored."""
+    body_path = cache_paths[0]
+    if "size" in cache_meta and body_path.stat().st_size != cache_meta["size"]:
+        return False
+    if "sha256" in cache_meta:
+        with open(body_path, "rb") as f:
+            return _file_sha256(f) == cache_meta["sha256"]
+    return True
+
+
+def _get_partial_paths(cache_paths):
+    """Return the (body, metadata) paths of an interrupted download in the cache."""
+    body_path, meta_path = cache_paths
+    return (
+        body_path.with_name(f"{body_path.name}.part"),
+        meta_path.with_name(f"{body_path.name}.part.json"),
+    )
+
+
+def _open_partial(cache_paths):
+    """
+    Open the file a download is written to, along with what is known about it.
+
+    With a cache directory, this is a ``.part`` file that survives across runs,
+    so an interrupted download is resumed by the next call. Without one, it is a
+    temporary file that only lives for the retries of a single call.
+    """
+    if not cache_paths:
+        partial_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)  # noqa: SIM115
+        return partial_file, {}
+
+    part_path, part_meta_path = _get_partial_paths(cache_paths)
+    resume_info = _read_json(part_meta_path) or {}
+    partial_file = open(part_path, "a+b")  # noqa: SIM115
+    if not resume_info and partial_file.seek(0, os.SEEK_END):
+        # Bytes of unknown origin cannot be resumed safely
+        partial_file.truncate(0)
+    return partial_file, resume_info
+
+
+def _get_resume_info(response):
+    """Collect what is needed to resume and verify a full (200) response later."""
+    content_length = response.headers.get("Content-Length")
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "size": int(content_length) if content_length and content_length.isdigit() else None,
+    }
+
+
+def _write_partial_meta(cache_paths, resume_info):
+    """Record the validators of a download in progress so a later run can resume it."""
+    if cache_paths:
+        _write_json(_get_partial_paths(cache_paths)[1], resume_info)
+
+
+def _get_resume_headers(offset, resume_info):
+    """
+    Build the headers that ask for the remainder of a partial download.
+
+    ``If-Range`` makes the server send the whole file instead if it changed since
+    the partial download started. Without a validator to send, resuming would risk
+    splicing two versions of the file together, so the download starts over.
+    """
+    etag = resume_info.get("etag")
+    validator = etag if etag and not etag.startswith("W/") else resume_info.get("last_modified")
+    if not validator:
+        return {}
+    return {"Range": f"bytes={offset}-", "If-Range": validator}
+
+
+def _check_content_range(response, offset):
+    """Make sure a 206 response continues exactly where the partial download stopped."""
+    content_range = response.headers.get("Content-Range", "")
+    if not content_range.startswith(f"bytes {offset}-"):
+        raise http.client.HTTPException(
+            f"Unexpected Content-Range {content_range!r} when resuming at byte {offset}"
+        )
+
+
+def _check_size(partial_file, resume_info):
+    """Raise if the downloaded file is shorter or longer than the server announced."""
+    expected_size = resume_info.get("size")
+    actual_size = partial_file.seek(0, os.SEEK_END)
+    if expected_size is not None and actual_size != expected_size:
+        raise http.client.IncompleteRead(b"", expected_size - actual_size)
+
+
+def _finish_download(cache_paths, url, partial_file, resume_info):
+    """Turn a complete download into the file handed back to the caller."""
+    sha256 = _file_sha256(partial_file)
+    size = partial_file.tell()
+    _record_content_hash(url, sha256)
+    if not cache_paths:
+        partial_file.seek(0)
+        return partial_file
+
+    partial_file.close()
+
+    body_path, meta_path = cache_paths
+    part_path, part_meta_path = _get_partial_paths(cache_paths)
+    os.replace(part_path, body_path)
+    _write_json(
+        meta_path,
+        {
+            "url": url,
+            "etag": resume_info.get("etag"),
+            "last_modified": resume_info.get("last_modified"),
+            "size": size,
+            "sha256": sha256,
+        },
+    )
+    part_meta_path.unlink(missing_ok=True)
+    return open(body_path, "rb")
+
+
+def _file_sha256(f):
+    """Return the SHA-256 hex digest of a binary file, read in chunks from the start."""
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,404 @@
+"""
+Backend-native bulk loading for the large population stages.
+
+On PostgreSQL, with ``GEOBANK_USE_COPY = True``, rows are streamed into a
+temporary table with ``COPY ... FROM STDIN`` and merged into the target table
+with a single ``INSERT ... ON CONFLICT DO UPDATE`` (or ``UPDATE ... FROM``).
+Both psycopg 3 (``cursor.copy``) and psycopg2 (``cursor.copy_expert``) are supported.
+
+On SQLite, an initial load into an empty table runs in fast-load mode: journal
+and sync PRAGMAs are relaxed for the run and rows are inserted with
+``executemany`` over multi-row statements (see ``SQLiteFastLoader``).
+
+``get_copy_loader`` and ``get_fast_loader`` return None when no such loader
+applies, and callers fall back to the ORM bulk operations.
+"""
+
+import datetime
+import io
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+logger = logging.getLogger(__name__)
+
+# Staging table column recording the order rows were written in, so that the
+# last row staged for a key wins the merge, as with the ORM and SQLite paths
+ORDINAL_COLUMN = "geobank_ordinal"
+
+
+def get_copy_loader(model):
+    """
+    Return a CopyLoader for ``model``, or None if COPY loading is not available.
+
+    Args:
+        model: The model class to load rows into.
+    """
+    if not getattr(settings, "GEOBANK_USE_COPY", False):
+        return None
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != "postgresql":
+        return None
+    return CopyLoader(model, connection)
+
+
+def get_fast_loader(model):
+    """
+    Return the fastest available loader for an upsert of ``model`` rows, or None.
+
+    This is a CopyLoader when ``get_copy_loader`` provides one, otherwise a
+    SQLiteFastLoader when the table is empty, outside of any transaction, on
+    SQLite (unless ``GEOBANK_SQLITE_FAST_LOAD = False``).
+
+    Args:
+        model: The model class to load rows into.
+    """
+    loader = get_copy_loader(model)
+    if loader is not None:
+        return loader
+
+    connection = connections[router.db_for_write(model)]
+    if (
+        connection.vendor != "sqlite"
+        or not getattr(settings, "GEOBANK_SQLITE_FAST_LOAD", True)
+        # journal_mode cannot be changed inside a transaction
+        or connection.in_atomic_block
+        or model.objects.exists()
+    ):
+        return None
+    return SQLiteFastLoader(model, connection)
+
+
+class CopyLoader:
+    """Loads model rows into PostgreSQL through a COPY-filled temporary table."""
+
+    def __init__(self, model, connection):
+        self.model = model
+        self.connection = connection
+        self.table = model._meta.db_table
+
+    @contextmanager
+    def session(self):
+        """Wrap a whole loading run; COPY needs no session-level setup."""
+        yield
+
+    @contextmanager
+    def upsert(self, conflict_field, update_fields, follow=None):
+        """
+        Stage objects with ``write()`` and merge them into the table on exit.
+
+        Every concrete field except the primary key is inserted, with the values
+        ``bulk_create`` would use (defaults, ``auto_now`` and slug fields included).
+        On a conflict on ``conflict_field``, only ``update_fields`` are overwritten.
+        Must be used inside a transaction.
+
+        Args:
+            conflict_field: Name of the unique field to merge on, e.g. ``"geoname_id"``.
+            update_fields: Names of the fields to update on existing rows.
+            follow: Optional mapping of field names to the field they copy; see
+                ``_get_assignments``.
+
+        Yields:
+            _StagedRows: Object whose ``write(objects)`` streams model instances.
+        """
+        fields = _get_insert_fields(self.model)
+        columns = [f.column for f in fields]
+        staging = self._create_staging_table(columns, ordinal=True)
+        staged = _StagedRows(self, staging, fields)
+        yield staged
+
+        if not staged.count:
+            return
+
+        qn = self.connection.ops.quote_name
+        conflict = qn(self.model._meta.get_field(conflict_field).column)
+        column_list = ", ".join(qn(c) for c in columns)
+        assignments = _get_assignments(self.model, update_fields, follow, "EXCLUDED", qn)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {qn(self.table)} ({column_list}) "  # nosec B608 - quoted identifiers
+                f"SELECT DISTINCT ON ({conflict}) {column_list} "
+                f"FROM {_quote_table(staging, self.connection)} "
+                f"ORDER BY {conflict}, {qn(ORDINAL_COLUMN)} DESC "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {assignments}"
+            )
+        logger.info(f"Merged {staged.count} rows into {self.table} with COPY")
+
+    def update(self, objects, fields):
+        """
+        Write ``fields`` of existing ``objects`` with one COPY and one ``UPDATE ... FROM``.
+
+        Args:
+            objects: Saved model instances.
+            fields: Names of the fields to write.
+        """
+        if not objects:
+            return
+
+        pk = self.model._meta.pk
+        model_fields = [self.model._meta.get_field(name) for name in fields]
+        columns = [pk.column] + [f.column for f in model_fields]
+        qn = self.connection.ops.quote_name
+
+        with transaction.atomic(using=self.connection.alias):
+            staging = self._create_staging_table(columns)
+            rows = (
+                [pk.get_db_prep_save(obj.pk, self.connection)]
+                + [
+                    f.get_db_prep_save(getattr(obj, f.attname), self.connection)
+                    for f in model_fields
+                ]
+                for obj in objects
+            )
+            with self.connection.cursor() as cursor:
+                copy_rows(cursor, staging, columns, rows, self.connection)
+                assignments = ", ".join(f"{qn(f.column)} = s.{qn(f.column)}" for f in model_fields)
+                cursor.execute(
+                    f"UPDATE {qn(self.table)} AS t SET {assignments} "  # nosec B608 - quoted identifiers
+                    f"FROM {_quote_table(staging, self.connection)} AS s "
+                    f"WHERE t.{qn(pk.column)} = s.{qn(pk.column)}"
+                )
+        logger.info(f"Updated {len(objects)} rows of {self.table} with COPY")
+
+    def _create_staging_table(self, columns, ordinal=False):
+        """
+        Create an empty temporary table with the given columns of the target table.
+
+        With ``ordinal``, the table also gets an ``ORDINAL_COLUMN``. The returned
+        name is qualified with ``pg_temp``, so it never refers to a permanent table.
+        """
+        qn = self.connection.ops.quote_name
+        name = f"geobank_staging_{self.table}"
+        staging = f"pg_temp.{name}"
+        select_list = ", ".join(qn(c) for c in columns)
+        if ordinal:
+            select_list += f", NULL::bigint AS {qn(ORDINAL_COLUMN)}"
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {_quote_table(staging, self.connection)}")
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {qn(name)} ON COMMIT DROP AS "  # nosec B608
+                f"SELECT {select_list} FROM {qn(self.table)} WITH NO DATA"
+            )
+        return staging
+
+
+class _StagedRows:
+    """Streams model instances into a staging table; see ``CopyLoader.upsert``."""
+
+    def __init__(self, loader, staging, fields):
+        self.loader = loader
+        self.staging = staging
+        self.fields = fields
+        self.count = 0
+
+    def write(self, objects):
+        """Stage unsaved model instances for the merge."""
+        connection = self.loader.connection
+        rows = [
+            _get_insert_values(self.fields, obj, connection) + [self.count + i]
+            for i, obj in enumerate(objects)
+        ]
+        if not rows:
+            return
+        columns = [f.column for f in self.fields] + [ORDINAL_COLUMN]
+        with connection.cursor() as cursor:
+            copy_rows(cursor, self.staging, columns, rows, connection)
+        self.count += len(rows)
+
+
+class SQLiteFastLoader:
+    """Inserts model rows into SQLite with relaxed durability for an initial load."""
+
+    # PRAGMAs applied for the run, restored to their previous values afterwards.
+    # With an in-memory rollback journal, an interrupted run can still be rolled
+    # back, but a crash of the process or machine may corrupt the database file.
+    PRAGMAS = {
+        "journal_mode": "MEMORY",
+        "synchronous": "OFF",
+        "cache_size": -256000,  # KiB
+        "temp_store": "MEMORY",
+    }
+
+    def __init__(self, model, connection):
+        self.model = model
+        self.connection = connection
+        self.table = model._meta.db_table
+
+    @contextmanager
+    def session(self):
+        """
+        Apply ``PRAGMAS`` for the run and restore the previous values on exit.
+
+        Must be entered outside of a transaction; the writes themselves should
+        run in one transaction inside it.
+        """
+        with self.connection.cursor() as cursor:
+            previous = {}
+            for name, value in self.PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}")
+                previous[name] = cursor.fetchone()[0]
+                cursor.execute(f"PRAGMA {name} = {value}")
+        logger.info(f"Using SQLite fast-load mode for {self.table}")
+        try:
+            yield
+        finally:
+            with self.connection.cursor() as cursor:
+                for name, value in previous.items():
+                    cursor.execute(f"PRAGMA {name} = {value}")
+
+    @contextmanager
+    def upsert(self, conflict_field, update_fields, follow=None):
+        """
+        Insert objects passed to ``write()``, merging rows that conflict on ``conflict_field``.
+
+        Rows are written as they arrive, with ``executemany`` over multi-row
+        ``INSERT`` statements sized to SQLite's bound-variable limit.
+
+        Args:
+            conflict_field: Name of the unique field to merge on, e.g. ``"geoname_id"``.
+            update_fields: Names of the fields to update on conflicting rows.
+            follow: Optional mapping of field names to the field they copy; see
+                ``_get_assignments``.
+
+        Yields:
+            _SQLiteInsertRows: Object whose ``write(objects)`` inserts model instances.
+        """
+        qn = self.connection.ops.quote_name
+        conflict = qn(self.model._meta.get_field(conflict_field).column)
+        assignments = _get_assignments(self.model, update_fields, follow, "excluded", qn)
+        yield _SQLiteInsertRows(self, f"ON CONFLICT ({conflict}) DO UPDATE SET {assignments}")
+
+
+class _SQLiteInsertRows:
+    """Inserts model instances in multi-row statements; see ``SQLiteFastLoader.upsert``."""
+
+    def __init__(self, loader, on_conflict):
+        self.loader = loader
+        self.on_conflict = on_conflict
+        self.fields = _get_insert_fields(loader.model)
+        self.count = 0
+
+    def write(self, objects):
+        """Insert unsaved model instances."""
+        if not objects:
+            return
+        connection = self.loader.connection
+        rows = [_get_insert_values(self.fields, obj, connection) for obj in objects]
+        per_statement = max(connection.ops.bulk_batch_size(self.fields, objects), 1)
+        full = len(rows) - len(rows) % per_statement
+
+        with connection.cursor() as cursor:
+            if full:
+                cursor.executemany(
+                    self._insert_sql(per_statement),
+                    [
+                        [value for row in rows[i : i + per_statement] for value in row]
+                        for i in range(0, full, per_statement)
+                    ],
+                )
+            if full < len(rows):
+                rest = rows[full:]
+                cursor.execute(
+                    self._insert_sql(len(rest)), [value for row in rest for value in row]
+                )
+        self.count += len(rows)
+
+    def _insert_sql(self, row_count):
+        qn = self.loader.connection.ops.quote_name
+        placeholders = f"({', '.join(['%s'] * len(self.fields))})"
+        return (
+            f"INSERT INTO {qn(self.loader.table)} "  # nosec B608 - quoted identifiers
+            f"({', '.join(qn(f.column) for f in self.fields)}) "
+            f"VALUES {', '.join([placeholders] * row_count)} {self.on_conflict}"
+        )
+
+
+def _get_insert_fields(model):
+    """Return the concrete fields written on insert, i.e. all but the primary key."""
+    return [f for f in model._meta.concrete_fields if not f.primary_key]
+
+
+def _get_insert_values(fields, obj, connection):
+    """Return the values ``bulk_create`` would insert for ``obj`` (defaults and slugs included)."""
+    return [f.get_db_prep_save(f.pre_save(obj, add=True), connection) for f in fields]
+
+
+def _get_assignments(model, update_fields, follow, excluded, qn):
+    """
+    Build the ``SET`` list of an ``ON CONFLICT ... DO UPDATE`` statement.
+
+    ``update_fields`` are always overwritten. A field in ``follow`` (mapped to
+    the field it copies, e.g. ``{"name_en": "name"}``) is only overwritten while
+    the stored value is empty or still equal to that field, so values set by
+    hand, such as translations, are kept.
+    """
+    table = qn(model._meta.db_table)
+    assignments = []
+    for name in update_fields:
+        column = qn(model._meta.get_field(name).column)
+        assignments.append(f"{column} = {excluded}.{column}")
+    for name, source in (follow or {}).items():
+        column = qn(model._meta.get_field(name).column)
+        stored = f"{table}.{column}"
+        copied = f"{table}.{qn(model._meta.get_field(source).column)}"
+        assignments.append(
+            f"{column} = CASE WHEN {stored} IS NULL OR {stored} = '' OR {stored} = {copied} "
+            f"THEN {excluded}.{column} ELSE {stored} END"
+        )
+    return ", ".join(assignments)
+
+
+def copy_rows(cursor, table, columns, rows, connection):
+    """
+    Stream rows into ``table`` with ``COPY ... FROM STDIN``.
+
+    Args:
+        cursor: A Django cursor on a PostgreSQL connection.
+        table: Name of the table to fill, optionally schema-qualified.
+        columns: Column names, in row order.
+        rows: Iterable of value sequences, already prepared for the database.
+        connection: The database connection, used to quote names.
+    """
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(c) for c in columns)
+    sql = f"COPY {_quote_table(table, connection)} ({columns}) FROM STDIN"
+    raw_cursor = cursor.cursor
+
+    if hasattr(raw_cursor, "copy"):
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+        return
+
+    # psycopg2
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(format_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    raw_cursor.copy_expert(sql, buffer)
+
+
+def _quote_table(table, connection):
+    """Quote a table name, quoting the schema and the name separately if it is qualified."""
+    return ".".join(connection.ops.quote_name(part) for part in table.split("."))
+
+
+def format_copy_value(value):
+    """Format one value for PostgreSQL's COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
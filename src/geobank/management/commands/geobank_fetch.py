@@ -0,0 +1,46 @@
+import logging
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from geobank.constants import GEONAMES_CITIES_THRESHOLDS
+from geobank.sources import mirror_sources
+
+
+class Command(BaseCommand):
+    help = "Download all GeoBank data sources into a local mirror directory (GEOBANK_DATA_DIR)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output-dir",
+            help="Directory to write the mirror to. Defaults to settings.GEOBANK_DATA_DIR",
+        )
+        parser.add_argument(
+            "--population-gte",
+            type=int,
+            nargs="+",
+            choices=GEONAMES_CITIES_THRESHOLDS,
+            help="Population thresholds to fetch city files for (default: 15000)",
+        )
+
+    def handle(self, *args, **options):
+        # Configure logging to show info messages on console
+        logger = logging.getLogger("geobank")
+        if not logger.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setLevel(logging.INFO)
+            formatter = logging.Formatter("%(message)s")
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+        output_dir = options.get("output_dir") or getattr(settings, "GEOBANK_DATA_DIR", None)
+        if not output_dir:
+            raise CommandError("Pass --output-dir or set GEOBANK_DATA_DIR in your settings.")
+
+        population_gte_values = tuple(options.get("population_gte") or [15000])
+
+        self.stdout.write(f"Fetching GeoBank data sources into {output_dir}...")
+        written = mirror_sources(output_dir, population_gte_values)
+        self.stdout.write(self.style.SUCCESS(f"Fetched {len(written)} files into {output_dir}."))
@@ -1,3 +1,4 @@
+import argparse
 import logging
 import sys
 
@@ -6,6 +7,14 @@ from django.core.management.base import BaseCommand
 from geobank.utils import populate_geobank_data
 
 
+def _positive_int(value):
+    """Argparse type for a strictly positive integer."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
 class Command(BaseCommand):
     help = "Populate GeoBank data with translations based on settings.LANGUAGES"
 
@@ -17,9 +26,20 @@ class Command(BaseCommand):
         )
         parser.add_argument(
             "--population-gte",
-            type=int,
-            choices=[500, 1000, 5000, 15000],
-            help="Choose the minimum population...",
+            type=_positive_int,
+            help="Minimum city population (any positive integer, default: 15000)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Run every stage, even if its source data is unchanged since the last run",
+        )
+        parser.add_argument(
+            "--countries",
+            nargs="+",
+            metavar="CODE",
+            help="Only populate regions and cities of these ISO alpha-2 country codes "
+            "(default: settings.GEOBANK_COUNTRIES, or every country)",
         )
 
     def handle(self, *args, **options):
@@ -34,12 +54,14 @@ class Command(BaseCommand):
             logger.setLevel(logging.INFO)
 
         population_gte = options.get("population_gte") or 15000
+        force = options["force"]
+        countries = options.get("countries")
 
         if options["background"]:
             try:
                 from geobank.tasks import populate_geobank_task
 
-                populate_geobank_task.delay(population_gte)
+                populate_geobank_task.delay(population_gte, force, countries)
                 self.stdout.write(
                     self.style.SUCCESS("GeoBank population task started in background.")
                 )
@@ -49,11 +71,11 @@ class Command(BaseCommand):
                         "Celery is not installed or configured. Running synchronously."
                     )
                 )
-                populate_geobank_data(population_gte)
+                populate_geobank_data(population_gte, force, countries)
                 self.stdout.write(self.style.SUCCESS("GeoBank population completed successfully."))
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"Error starting background task: {e}"))
         else:
             self.stdout.write("Starting GeoBank population...")
-            populate_geobank_data(population_gte)
+            populate_geobank_data(population_gte, force, countries)
             self.stdout.write(self.style.SUCCESS("GeoBank population completed successfully."))
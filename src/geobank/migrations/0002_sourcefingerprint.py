@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geobank", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SourceFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("stage", models.CharField(max_length=50, unique=True, verbose_name="Stage")),
+                ("fingerprint", models.CharField(max_length=64, verbose_name="Fingerprint")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated At")),
+            ],
+            options={
+                "verbose_name": "Source Fingerprint",
+                "verbose_name_plural": "Source Fingerprints",
+            },
+        ),
+    ]
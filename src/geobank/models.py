@@ -219,3 +219,18 @@ class City(BaseModel):
 
     def __str__(self):
         return f"{self.name}, {self.country.code2}"
+
+
+class SourceFingerprint(models.Model):
+    """Content hash of the source data a population stage last ran with successfully."""
+
+    stage = models.CharField(max_length=50, unique=True, verbose_name=_("Stage"))
+    fingerprint = models.CharField(max_length=64, verbose_name=_("Fingerprint"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated At"))
+
+    class Meta:
+        verbose_name = _("Source Fingerprint")
+        verbose_name_plural = _("Source Fingerprints")
+
+    def __str__(self):
+        return f"{self.stage}: {self.fingerprint}"
@@ -2,80 +2,152 @@
 Data parsing functions for fetching and parsing geographic data from external sources.
 """
 
+import functools
 import io
 import json
 import logging
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
 
-from .constants import (
-    GEONAMES_CITIES_URL_TEMPLATE,
-    GEONAMES_COUNTRY_INFO_URL,
-    GEONAMES_REGION_INFO_URL,
-    RESTCOUNTRIES_CURRENCIES_URL,
-    RESTCOUNTRIES_FLAGS_URL,
-    RESTCOUNTRIES_LANGUAGES_URL,
-)
-from .downloaders import download_with_retry
+from django.conf import settings
+
+from .downloaders import download_to_file, download_with_retry
+from .snapshots import iter_with_snapshot
+from .sources import get_city_file_threshold, get_source_url
 
 logger = logging.getLogger(__name__)
 
+# Chunks handed to each worker process when parsing cities in parallel
+CITY_CHUNKS_PER_WORKER = 4
+
+# Geonames feature code of national capitals, kept regardless of population
+CAPITAL_FEATURE_CODE = "PPLC"
+
+
+class CountryRecord(NamedTuple):
+    """A country row from geonames countryInfo.txt."""
+
+    code2: str
+    code3: str
+    fips: str
+    name: str
+    name_ascii: str
+    population: Optional[int]
+    continent: str
+    tld: str
+    currency_code: str
+    currency_name: str
+    calling_codes: List[str]
+    postal_code_format: str
+    postal_code_regex: str
+    languages: str
+    geoname_id: int
+    neighbors: str
+
+
+class RegionRecord(NamedTuple):
+    """A region row from geonames admin1CodesASCII.txt."""
+
+    country_code: str
+    region_code: str
+    name: str
+    name_ascii: str
+    geoname_id: int
+
+
+class CityRecord(NamedTuple):
+    """A city row from a geonames citiesN.txt dump, with numeric coordinates."""
+
+    geoname_id: int
+    name: str
+    name_ascii: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+    country_code: str
+    region_code: str
+    population: Optional[int]
+    timezone: Optional[str]
+
+
+def get_allowed_countries(countries=None):
+    """
+    Return the country allow-list, or None when every country is wanted.
+
+    Args:
+        countries: ISO alpha-2 country codes. Defaults to the ``GEOBANK_COUNTRIES`` setting.
+
+    Returns:
+        frozenset | None: Upper-case country codes to keep, or None for no restriction.
+    """
+    if countries is None:
+        countries = getattr(settings, "GEOBANK_COUNTRIES", None)
+    if not countries:
+        return None
+    return frozenset(code.strip().upper() for code in countries)
+
 
 def parse_country_data():
     """
     Fetches and parses country data from geonames.org.
 
     Returns:
-        list: List of dictionaries containing country data.
+        list: List of CountryRecord tuples.
     """
-    data = []
+    url = get_source_url("countries")
     try:
-        content_bytes = download_with_retry(GEONAMES_COUNTRY_INFO_URL)
-        content = content_bytes.decode("utf-8")
-
-        for line in content.splitlines():
-            if line.startswith("#") or not line.strip():
-                continue
-
-            parts = line.split("\t")
-            if len(parts) < 17:
-                continue
-
-            # ISO(0), ISO3(1), ISO-Numeric(2), fips(3), Country(4), Capital(5), Area(6),
-            # Population(7), Continent(8), tld(9), CurrencyCode(10), CurrencyName(11),
-            # Phone(12), Postal Code Format(13), Postal Code Regex(14), Languages(15),
-            # geonameid(16), neighbours(17), EquivalentFipsCode(18)
-
-            try:
-                geoname_id = int(parts[16])
-            except ValueError:
-                continue
-
-            calling_codes = _parse_calling_codes(parts[12])
-
-            data.append(
-                {
-                    "code2": parts[0],
-                    "code3": parts[1],
-                    "fips": parts[3],
-                    "name": parts[4],
-                    "name_ascii": parts[4],  # Assuming ASCII/English
-                    "population": parts[7],
-                    "continent": parts[8],
-                    "tld": parts[9],
-                    "currency_code": parts[10],
-                    "currency_name": parts[11],
-                    "calling_codes": calling_codes,
-                    "postal_code_format": parts[13],
-                    "postal_code_regex": parts[14],
-                    "languages": parts[15],
-                    "geoname_id": geoname_id,
-                    "neighbors": parts[17],
-                }
-            )
+        content = download_with_retry(url).decode("utf-8")
+        return list(iter_with_snapshot("countries", url, [], lambda: _iter_country_rows(content)))
     except Exception as e:
         logger.error(f"Error fetching country data: {e}")
-
-    return data
+        return []
+
+
+def _iter_country_rows(content: str):
+    """Yield a CountryRecord for every valid line of countryInfo.txt."""
+    for line in content.splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+
+        parts = line.split("\t")
+        if len(parts) < 17:
+            continue
+
+        # ISO(0), ISO3(1), ISO-Numeric(2), fips(3), Country(4), Capital(5), Area(6),
+        # Population(7), Continent(8), tld(9), CurrencyCode(10), CurrencyName(11),
+        # Phone(12), Postal Code Format(13), Postal Code Regex(14), Languages(15),
+        # geonameid(16), neighbours(17), EquivalentFipsCode(18)
+
+        try:
+            geoname_id = int(parts[16])
+        except ValueError:
+            continue
+
+        try:
+            population = int(parts[7]) if parts[7] else None
+        except ValueError:
+            population = None
+
+        calling_codes = _parse_calling_codes(parts[12])
+
+        yield CountryRecord(
+            code2=parts[0],
+            code3=parts[1],
+            fips=parts[3],
+            name=parts[4],
+            name_ascii=parts[4],  # Assuming ASCII/English
+            population=population,
+            continent=parts[8],
+            tld=parts[9],
+            currency_code=parts[10],
+            currency_name=parts[11],
+            calling_codes=calling_codes,
+            postal_code_format=parts[13],
+            postal_code_regex=parts[14],
+            languages=parts[15],
+            geoname_id=geoname_id,
+            neighbors=parts[17],
+        )
 
 
 def _parse_calling_codes(raw_calling_code: str) -> list:
@@ -100,144 +172,367 @@ def _parse_calling_codes(raw_calling_code: str) -> list:
     return calling_codes
 
 
-def parse_region_data():
+def parse_region_data(countries=None):
     """
     Fetches and parses region data from geonames.org.
 
+    Args:
+        countries: Only keep regions of these countries (see ``get_allowed_countries``).
+
     Returns:
-        list: List of dictionaries containing region data.
+        list: List of RegionRecord tuples.
     """
-    data = []
+    allowed_countries = get_allowed_countries(countries)
+    params = [sorted(allowed_countries) if allowed_countries is not None else None]
+    url = get_source_url("regions")
     try:
-        content_bytes = download_with_retry(GEONAMES_REGION_INFO_URL)
-        content = content_bytes.decode("utf-8")
-
-        for line in content.splitlines():
-            if line.startswith("#") or not line.strip():
-                continue
-
-            parts = line.split("\t")
-            if len(parts) < 4:
-                continue
-
-            # code(0), name(1), name_ascii(2), geoname_id(3)
-            code_parts = parts[0].split(".")
-            if len(code_parts) < 2:
-                continue
-
-            country_code = code_parts[0]
-            region_code = code_parts[1]
-
-            try:
-                geoname_id = int(parts[3])
-            except ValueError:
-                continue
-
-            data.append(
-                {
-                    "country_code": country_code,
-                    "region_code": region_code,
-                    "name": parts[1],
-                    "name_ascii": parts[2],
-                    "geoname_id": geoname_id,
-                }
+        content = download_with_retry(url).decode("utf-8")
+        return list(
+            iter_with_snapshot(
+                "regions", url, params, lambda: _iter_region_rows(content, allowed_countries)
             )
+        )
     except Exception as e:
         logger.error(f"Error fetching region data: {e}")
-
-    return data
-
-
-def parse_city_data(population_gte: int = 15000):
+        return []
+
+
+def _iter_region_rows(content: str, countries=None):
+    """Yield a RegionRecord for every valid line of admin1CodesASCII.txt in ``countries``."""
+    for line in content.splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+
+        parts = line.split("\t")
+        if len(parts) < 4:
+            continue
+
+        # code(0), name(1), name_ascii(2), geoname_id(3)
+        code_parts = parts[0].split(".")
+        if len(code_parts) < 2:
+            continue
+
+        country_code = code_parts[0]
+        region_code = code_parts[1]
+        if countries is not None and country_code not in countries:
+            continue
+
+        try:
+            geoname_id = int(parts[3])
+        except ValueError:
+            continue
+
+        yield RegionRecord(
+            country_code=country_code,
+            region_code=region_code,
+            name=parts[1],
+            name_ascii=parts[2],
+            geoname_id=geoname_id,
+        )
+
+
+def parse_city_data(
+    population_gte: int = 15000,
+    columnar: bool = False,
+    workers: Optional[int] = None,
+    countries=None,
+):
     """
     Fetches and parses city data from geonames.org.
 
     Args:
         population_gte: Minimum population threshold for cities.
+        columnar: Return a NumPy-backed ``CityTable`` instead of a list. Requires numpy.
+        workers: Number of processes to parse with (see ``iter_city_data``).
+        countries: Only keep cities of these countries (see ``get_allowed_countries``).
 
     Returns:
-        list: List of dictionaries containing city data.
+        list | CityTable: List of CityRecord tuples, or a CityTable if ``columnar``.
+    """
+    if columnar:
+        try:
+            from .tables import CityTable
+        except ImportError as e:
+            raise ImportError(
+                "Columnar city data requires numpy. Install it with 'pip install geobank[numpy]'."
+            ) from e
+
+        return CityTable.from_records(iter_city_data(population_gte, workers, countries))
+
+    return list(iter_city_data(population_gte, workers, countries))
+
+
+def iter_city_data(
+    population_gte: int = 15000,
+    workers: Optional[int] = None,
+    countries=None,
+    strict: bool = False,
+):
+    """
+    Fetches city data from geonames.org and yields it one city at a time.
+
+    With a single worker, records are read lazily from the zip member, so memory use
+    does not grow with the number of cities as long as the caller does not keep them
+    all. With more workers, the decompressed member is split into newline-aligned
+    chunks that are parsed in a process pool and yielded back in file order.
+
+    Any threshold is accepted: the cities are read from the best published file
+    (see ``sources.get_city_file_threshold``) and filtered locally. Capitals are
+    always kept, as in the published files.
+
+    With ``GEOBANK_SNAPSHOTS`` enabled, the parsed cities are also saved next to the
+    download cache and read back on later runs over the same source file (see
+    ``geobank.snapshots``).
+
+    Args:
+        population_gte: Minimum population threshold for cities.
+        workers: Number of processes to parse with. Defaults to the
+            ``GEOBANK_PARSE_WORKERS`` setting, or 1.
+        countries: Only keep cities of these countries (see ``get_allowed_countries``).
+            Other rows are dropped before their fields are converted.
+        strict: Raise errors instead of logging them. Otherwise a failure simply ends
+            the iteration, which callers cannot tell apart from the end of the data.
+
+    Yields:
+        CityRecord: One parsed city.
     """
-    file_name = f"cities{population_gte}"
-    url = GEONAMES_CITIES_URL_TEMPLATE.format(population=population_gte)
-    data = []
+    file_population = get_city_file_threshold(population_gte)
+    file_name = f"cities{file_population}"
+    url = get_source_url("cities", file_population)
+    # Only filter when the file holds more cities than requested
+    min_population = population_gte if population_gte > file_population else None
+    allowed_countries = get_allowed_countries(countries)
+    if workers is None:
+        workers = getattr(settings, "GEOBANK_PARSE_WORKERS", None) or 1
+
+    params = [population_gte, sorted(allowed_countries) if allowed_countries is not None else None]
 
     try:
-        zip_content = download_with_retry(url)
-
-        with zipfile.ZipFile(io.BytesIO(zip_content)) as z:
-            with z.open(f"{file_name}.txt") as f:
-                with io.TextIOWrapper(f, encoding="utf-8") as text_file:
-                    for line in text_file:
-                        if not line.strip():
-                            continue
-
-                        parts = line.split("\t")
-                        if len(parts) < 19:
-                            continue
-
-                        try:
-                            geoname_id = int(parts[0])
-                        except ValueError:
-                            continue
-
-                        # Parse population
-                        try:
-                            population = int(parts[14]) if parts[14] else None
-                        except ValueError:
-                            population = None
-
-                        data.append(
-                            {
-                                "geoname_id": geoname_id,
-                                "name": parts[1],
-                                "name_ascii": parts[2],
-                                "latitude": parts[4],
-                                "longitude": parts[5],
-                                "country_code": parts[8],
-                                "region_code": parts[10],
-                                "population": population,
-                                "timezone": parts[17] if len(parts) > 17 else None,
-                            }
-                        )
+        with download_to_file(url) as zip_file:
+            yield from iter_with_snapshot(
+                "cities",
+                url,
+                params,
+                lambda: _iter_city_file(
+                    zip_file, f"{file_name}.txt", workers, min_population, allowed_countries
+                ),
+            )
     except Exception as e:
+        if strict:
+            raise
         logger.error(f"Error fetching city data: {e}")
 
-    return data
 
+def _iter_city_file(zip_file, member: str, workers: int, min_population=None, countries=None):
+    """
+    Parse the cities member of a geonames zip file.
+
+    Args:
+        zip_file: Binary file object of the zip archive.
+        member: Name of the cities text file inside the archive.
+        workers: Number of processes to parse with.
+        min_population: Skip cities below this population, except capitals.
+        countries: Set of country codes to keep, or None to keep every country.
+
+    Yields:
+        CityRecord: Parsed cities, in file order.
+    """
+    with zipfile.ZipFile(zip_file) as z:
+        with z.open(member) as f:
+            if workers > 1:
+                yield from _parse_city_chunks_in_parallel(
+                    f.read(), workers, min_population, countries
+                )
+                return
+
+            with io.TextIOWrapper(f, encoding="utf-8") as text_file:
+                for line in text_file:
+                    record = _parse_city_line(line, min_population, countries)
+                    if record is not None:
+                        yield record
+
+
+def _parse_city_line(
+    line: str, min_population: Optional[int] = None, countries=None
+) -> Optional[CityRecord]:
+    """
+    Parse one line of a geonames cities file.
+
+    Args:
+        line: A tab-separated line from citiesN.txt.
+        min_population: Skip cities below this population, except capitals.
+        countries: Set of country codes to keep, or None to keep every country.
+
+    Returns:
+        CityRecord or None if the line is blank, malformed or filtered out.
+    """
+    if not line.strip():
+        return None
+
+    parts = line.split("\t")
+    if len(parts) < 19:
+        return None
+
+    if countries is not None and parts[8] not in countries:
+        return None
+
+    try:
+        geoname_id = int(parts[0])
+    except ValueError:
+        return None
+
+    # Parse population
+    try:
+        population = int(parts[14]) if parts[14] else None
+    except ValueError:
+        population = None
 
-def parse_languages_data():
+    if (
+        min_population is not None
+        and (population or 0) < min_population
+        and parts[7] != CAPITAL_FEATURE_CODE
+    ):
+        return None
+
+    try:
+        latitude = float(parts[4])
+        longitude = float(parts[5])
+    except ValueError:
+        latitude = longitude = None
+
+    return CityRecord(
+        geoname_id=geoname_id,
+        name=parts[1],
+        name_ascii=parts[2],
+        latitude=latitude,
+        longitude=longitude,
+        country_code=parts[8],
+        region_code=parts[10],
+        population=population,
+        timezone=parts[17] if len(parts) > 17 else None,
+    )
+
+
+def _parse_city_chunk(
+    chunk: bytes, min_population: Optional[int] = None, countries=None
+) -> List[CityRecord]:
+    """Parse a newline-aligned chunk of a cities file. Runs in a worker process."""
+    records = []
+    for line in chunk.decode("utf-8").splitlines():
+        record = _parse_city_line(line, min_population, countries)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def _split_lines(content: bytes, chunks: int) -> List[Tuple[int, int]]:
     """
-    Fetches and parses language data from restcountries API.
+    Split ``content`` into roughly equal byte ranges that end on a newline.
+
+    Args:
+        content: The bytes to split.
+        chunks: Desired number of ranges.
+
+    Returns:
+        list: (start, end) offsets covering the whole content, in order.
+    """
+    ranges = []
+    size = len(content)
+    step = max(1, -(-size // chunks))
+    start = 0
+    while start < size:
+        end = content.find(b"\n", min(start + step, size) - 1)
+        end = size if end == -1 else end + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _parse_city_chunks_in_parallel(
+    content: bytes, workers: int, min_population: Optional[int] = None, countries=None
+):
+    """
+    Parse the decompressed cities file in a process pool.
+
+    Args:
+        content: The whole decompressed citiesN.txt member.
+        workers: Number of worker processes.
+        min_population: Skip cities below this population, except capitals.
+        countries: Set of country codes to keep, or None to keep every country.
+
+    Yields:
+        CityRecord: Parsed cities, in file order.
+    """
+    ranges = _split_lines(content, workers * CITY_CHUNKS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = (content[start:end] for start, end in ranges)
+        parse_chunk = functools.partial(
+            _parse_city_chunk, min_population=min_population, countries=countries
+        )
+        for records in executor.map(parse_chunk, chunks):
+            yield from records
+
+
+def load_restcountries_data():
+    """
+    Fetches the combined restcountries payload used by the languages, currencies
+    and flags parsers.
+
+    Fetching it once and passing the result to each parser replaces three
+    requests and three JSON decodes with one.
+
+    Returns:
+        list: One dictionary per country, with cca2, languages, currencies and flags.
+    """
+    try:
+        return json.loads(download_with_retry(get_source_url("restcountries")))
+    except Exception as e:
+        logger.error(f"Error fetching restcountries data: {e}")
+        return []
+
+
+def parse_languages_data(restcountries_data=None):
+    """
+    Parses language data from the restcountries API.
+
+    Args:
+        restcountries_data: Payload from ``load_restcountries_data``. Fetched when omitted.
 
     Returns:
         dict: Dictionary mapping language codes to names.
     """
+    if restcountries_data is None:
+        restcountries_data = load_restcountries_data()
+
     all_languages = {}
     try:
-        response_data = json.loads(download_with_retry(RESTCOUNTRIES_LANGUAGES_URL))
-        for country_data in response_data:
+        for country_data in restcountries_data:
             languages = country_data.get("languages", {})
             for code, name in languages.items():
                 if code and len(code) == 3:  # 3-letter ISO 639-2 codes
                     all_languages[code.lower()] = name
     except Exception as e:
-        logger.error(f"Error fetching languages data: {e}")
+        logger.error(f"Error parsing languages data: {e}")
 
     return all_languages
 
 
-def parse_currencies_data():
+def parse_currencies_data(restcountries_data=None):
     """
-    Fetches and parses currency data from restcountries API.
+    Parses currency data from the restcountries API.
+
+    Args:
+        restcountries_data: Payload from ``load_restcountries_data``. Fetched when omitted.
 
     Returns:
         dict: Dictionary mapping currency codes to info dicts.
     """
+    if restcountries_data is None:
+        restcountries_data = load_restcountries_data()
+
     all_currencies = {}
     try:
-        response_data = json.loads(download_with_retry(RESTCOUNTRIES_CURRENCIES_URL))
-        for country_data in response_data:
+        for country_data in restcountries_data:
             currencies = country_data.get("currencies", {})
             for code, info in currencies.items():
                 if code and len(code) == 3:
@@ -246,24 +541,29 @@ def parse_currencies_data():
                         "symbol": info.get("symbol", ""),
                     }
     except Exception as e:
-        logger.error(f"Error fetching currencies data: {e}")
+        logger.error(f"Error parsing currencies data: {e}")
 
     return all_currencies
 
 
-def parse_flags_data():
+def parse_flags_data(restcountries_data=None):
     """
-    Fetches and parses flag data from restcountries API.
+    Parses flag data from the restcountries API.
+
+    Args:
+        restcountries_data: Payload from ``load_restcountries_data``. Fetched when omitted.
 
     Returns:
         dict: Dictionary mapping country codes to flag URLs.
     """
+    if restcountries_data is None:
+        restcountries_data = load_restcountries_data()
+
     flags_data = {}
     try:
-        response_data = json.loads(download_with_retry(RESTCOUNTRIES_FLAGS_URL))
-        for row in response_data:
+        for row in restcountries_data:
             flags_data[row["cca2"]] = row["flags"]
     except Exception as e:
-        logger.error(f"Error fetching flags data: {e}")
+        logger.error(f"Error parsing flags data: {e}")
 
     return flags_data
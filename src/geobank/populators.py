@@ -2,347 +2,793 @@
 Database population functions for populating geobank models with data.
 """
 
+import codecs
+import io
+import itertools
 import json
 import logging
 import zipfile
+from contextlib import nullcontext
 
-import tqdm
+import django
 from django.core.exceptions import FieldDoesNotExist
-from django.db import transaction
+from django.db import connections, models, router, transaction
+from tqdm import tqdm
 
-from .constants import (
-    GEOBANK_TRANSLATIONS_URL,
-    ISO_639_2_TO_1,
-)
-from .downloaders import download_with_retry
+from .constants import ISO_639_2_TO_1
+from .downloaders import download_to_file
+from .loaders import get_copy_loader, get_fast_loader
 from .models import CallingCode, City, Country, Currency, Language, Region
 from .parsers import (
-    parse_city_data,
+    get_allowed_countries,
+    iter_city_data,
     parse_country_data,
     parse_currencies_data,
     parse_flags_data,
     parse_languages_data,
     parse_region_data,
 )
+from .sources import get_source_url
 
 logger = logging.getLogger(__name__)
 
+# Cities are read, matched and written in batches of this size, which bounds memory use.
+CITY_BATCH_SIZE = 1000
+
+# Fields written when an existing region or city is updated. The sync owns
+# is_active: a region or city in the source is always active, so deactivating
+# one by hand only lasts until the next run; use GEOBANK_COUNTRIES to leave out
+# countries instead.
+REGION_UPDATE_FIELDS = ["name", "code", "name_ascii", "country", "is_active"]
+CITY_UPDATE_FIELDS = [
+    "name",
+    "name_ascii",
+    "latitude",
+    "longitude",
+    "country",
+    "region",
+    "population",
+    "timezone",
+    "is_active",
+]
+
+# Rows per UPDATE when deactivating regions and cities that left the source
+DEACTIVATE_BATCH_SIZE = 500
+
+# Rows per INSERT/UPDATE statement for the small reference tables
+BULK_BATCH_SIZE = 500
+
+# Bytes read at a time when streaming the translation JSON files
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Characters that may follow a complete JSON value
+JSON_DELIMITERS = frozenset(" \t\n\r,:]}")
 
-def populate_languages():
-    """Populate Language model from restcountries API data."""
+
+def populate_languages(restcountries_data=None):
+    """
+    Populate Language model from restcountries API data.
+
+    Args:
+        restcountries_data: Payload from ``load_restcountries_data``. Fetched when omitted.
+
+    Returns:
+        bool: True if the data was populated, False if it could not be (the error is logged).
+    """
     logger.info("Populating languages...")
 
     try:
-        all_languages = parse_languages_data()
+        all_languages = parse_languages_data(restcountries_data)
+        if not all_languages:
+            logger.warning("No language data received, leaving languages unchanged.")
+            return False
 
-        for code, name in all_languages.items():
+        rows = {
             # Get the 2-letter code if it exists
-            code2 = ISO_639_2_TO_1.get(code, "")
-            Language.objects.update_or_create(
-                code=code,
-                defaults={
-                    "code2": code2,
-                    "name": name,
-                },
-            )
+            code: {"code2": ISO_639_2_TO_1.get(code, ""), "name": name}
+            for code, name in all_languages.items()
+        }
+        created, updated = _bulk_upsert(Language, "code", rows)
+        logger.info(f"Languages populated. Created: {created}, Updated: {updated}")
     except Exception as e:
         logger.error(f"Error populating languages: {e}")
+        return False
+    return True
+
+
+def populate_currencies(restcountries_data=None):
+    """
+    Populate Currency model from restcountries API data.
 
+    Args:
+        restcountries_data: Payload from ``load_restcountries_data``. Fetched when omitted.
 
-def populate_currencies():
-    """Populate Currency model from restcountries API data."""
+    Returns:
+        bool: True if the data was populated, False if it could not be (the error is logged).
+    """
     logger.info("Populating currencies...")
 
     try:
-        all_currencies = parse_currencies_data()
-
-        for code, info in all_currencies.items():
-            Currency.objects.update_or_create(
-                code=code,
-                defaults={
-                    "name": info["name"],
-                    "symbol": info["symbol"],
-                },
-            )
+        all_currencies = parse_currencies_data(restcountries_data)
+        if not all_currencies:
+            logger.warning("No currency data received, leaving currencies unchanged.")
+            return False
+
+        rows = {
+            code: {"name": info["name"], "symbol": info["symbol"]}
+            for code, info in all_currencies.items()
+        }
+        created, updated = _bulk_upsert(Currency, "code", rows)
+        logger.info(f"Currencies populated. Created: {created}, Updated: {updated}")
     except Exception as e:
         logger.error(f"Error populating currencies: {e}")
+        return False
+    return True
+
+
+def _bulk_upsert(model, key_field, rows):
+    """
+    Create or update rows of ``model`` with a constant number of queries.
+
+    The stored values of ``rows``' fields are loaded once as a projection, without
+    building model instances. New rows are inserted with ``bulk_create`` and changed
+    rows are written with ``bulk_update``, all in a single transaction. Rows
+    whose values are already current are not written. ``name`` is compared and
+    written untranslated; see ``_get_followed_fields``.
+
+    Args:
+        model: The model class.
+        key_field: Name of the unique field identifying a row.
+        rows: Dict mapping key values to dicts of the other field values, keyed by attname.
+
+    Returns:
+        tuple: (created, updated) row counts.
+    """
+    fields = sorted({field for values in rows.values() for field in values})
+    followed = list(_get_followed_fields(model, fields))
+    to_create = []
+    # Rows whose name translation still copies name get it updated along with name
+    to_follow = []
+    to_update = []
+
+    with transaction.atomic():
+        queryset = _untranslated(model.objects.all())
+        existing = {
+            key: (pk, dict(zip(fields + followed, stored)))
+            for key, pk, *stored in queryset.filter(**{f"{key_field}__in": list(rows)}).values_list(
+                key_field, "pk", *fields, *followed
+            )
+        }
+        for key, values in rows.items():
+            if key not in existing:
+                to_create.append(model(**{key_field: key}, **values))
+                continue
+            pk, stored = existing[key]
+            follows = followed and _follows_name(stored, followed[0])
+            if any(stored[field] != value for field, value in values.items()) or (
+                follows and stored[followed[0]] != values["name"]
+            ):
+                obj = model(pk=pk, **{key_field: key}, **values)
+                (to_follow if follows else to_update).append(obj)
+
+        if to_create:
+            model.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        for objects, update_fields in ((to_follow, fields + followed), (to_update, fields)):
+            if objects:
+                queryset.bulk_update(objects, update_fields, batch_size=BULK_BATCH_SIZE)
+
+    return len(to_create), len(to_follow) + len(to_update)
 
 
 def populate_countries():
-    """Populate Country model and related data from geonames."""
+    """
+    Populate Country model and related data from geonames.
+
+    Countries, calling codes and the language and neighbor relations are each
+    written with a constant number of bulk queries: rows are diffed against the
+    database, only new rows are inserted and only stale rows are deleted.
+
+    Returns:
+        bool: True if the data was populated, False if it could not be (the error is logged).
+    """
     logger.info("Populating countries...")
     data = parse_country_data()
+    if not data:
+        logger.warning("No country data received, leaving countries unchanged.")
+        return False
 
     # Build lookup maps
-    currencies = {c.code: c for c in Currency.objects.all()}
+    currencies = dict(Currency.objects.values_list("code", "id"))
     languages_map = _build_languages_map()
 
-    # Store country data for neighbor processing
-    country_neighbors_map = {}
-
-    for item in data:
-        country = _create_or_update_country(item, currencies)
-        _update_calling_codes(country, item["calling_codes"])
-        _assign_languages(country, item["languages"], languages_map)
-
-        # Store neighbors for later processing (after all countries are created)
-        if item["neighbors"]:
-            country_neighbors_map[item["code2"]] = item["neighbors"].split(",")
+    with transaction.atomic():
+        created, updated = _bulk_upsert(
+            Country,
+            "geoname_id",
+            {item.geoname_id: _get_country_values(item, currencies) for item in data},
+        )
+        logger.info(f"Countries populated. Created: {created}, Updated: {updated}")
 
-    # Update neighbors (second pass, after all countries exist)
-    _update_neighbors(country_neighbors_map)
+        country_ids = dict(Country.objects.values_list("code2", "id"))
+        _update_calling_codes(data, country_ids)
+        _assign_languages(data, country_ids, languages_map)
+        _update_neighbors(data, country_ids)
+    return True
 
 
 def _build_languages_map():
-    """Build a map of language codes to Language objects (both 2-letter and 3-letter)."""
+    """Build a map of language codes to Language ids (both 2-letter and 3-letter)."""
     languages_map = {}
-    for lang in Language.objects.all():
-        languages_map[lang.code] = lang  # 3-letter code
-        if lang.code2:
-            languages_map[lang.code2] = lang  # 2-letter code
+    for lang_id, code, code2 in Language.objects.values_list("id", "code", "code2"):
+        languages_map[code] = lang_id  # 3-letter code
+        if code2:
+            languages_map[code2] = lang_id  # 2-letter code
     return languages_map
 
 
-def _create_or_update_country(item, currencies):
-    """Create or update a country record."""
-    # Parse population
-    try:
-        population = int(item["population"]) if item["population"] else None
-    except ValueError:
-        population = None
-
-    # Get currency
-    currency = currencies.get(item["currency_code"])
-
-    country, _ = Country.objects.update_or_create(
-        geoname_id=item["geoname_id"],
-        defaults={
-            "name": item["name"],
-            "name_ascii": item["name_ascii"],
-            "fips": item["fips"],
-            "continent": item["continent"],
-            "population": population,
-            "tld": item["tld"],
-            "code2": item["code2"],
-            "code3": item["code3"],
-            "currency": currency,
-            "postal_code_format": item["postal_code_format"],
-            "postal_code_regex": item["postal_code_regex"],
-        },
-    )
-    return country
+def _get_country_values(item, currencies):
+    """Return the Country field values for a parsed country."""
+    return {
+        "name": item.name,
+        "name_ascii": item.name_ascii,
+        "fips": item.fips,
+        "continent": item.continent,
+        "population": item.population,
+        "tld": item.tld,
+        "code2": item.code2,
+        "code3": item.code3,
+        "currency_id": currencies.get(item.currency_code),
+        "postal_code_format": item.postal_code_format,
+        "postal_code_regex": item.postal_code_regex,
+    }
 
 
-def _update_calling_codes(country, calling_codes):
-    """Update calling codes for a country."""
-    country.calling_codes.all().delete()
-    for code in calling_codes:
-        CallingCode.objects.create(country=country, code=code)
+def _update_calling_codes(data, country_ids):
+    """Bring the calling codes of the parsed countries in line with the source data."""
+    wanted = {
+        (country_ids[item.code2], code)
+        for item in data
+        if item.code2 in country_ids
+        for code in item.calling_codes
+    }
+    scope = {country_ids[item.code2] for item in data if item.code2 in country_ids}
+
+    existing = {}
+    for code_id, country_id, code in CallingCode.objects.filter(country_id__in=scope).values_list(
+        "id", "country_id", "code"
+    ):
+        existing.setdefault((country_id, code), []).append(code_id)
+
+    # Keep one row per wanted pair, delete the rest (stale codes and duplicates)
+    stale_ids = [
+        code_id
+        for pair, code_ids in existing.items()
+        for code_id in (code_ids if pair not in wanted else code_ids[1:])
+    ]
+    if stale_ids:
+        CallingCode.objects.filter(id__in=stale_ids).delete()
+
+    new_codes = [
+        CallingCode(country_id=country_id, code=code)
+        for country_id, code in sorted(wanted - set(existing))
+    ]
+    if new_codes:
+        CallingCode.objects.bulk_create(new_codes, batch_size=BULK_BATCH_SIZE)
 
 
-def _assign_languages(country, languages_str, languages_map):
-    """Assign languages to a country based on geonames language codes."""
+def _assign_languages(data, country_ids, languages_map):
+    """Write the country-language relations of the parsed countries in bulk."""
     # Geonames uses 2-letter codes like "en", "ar-AE", "fa-AF"
-    if languages_str:
-        lang_codes = languages_str.split(",")
-        country_languages = []
-        for lang_code in lang_codes:
+    wanted = set()
+    scope = set()
+    for item in data:
+        country_id = country_ids.get(item.code2)
+        if country_id is None or not item.languages:
+            continue
+        scope.add(country_id)
+        for lang_code in item.languages.split(","):
             # Language codes can be like "en-US" or "en", we want the base 2-letter code
             base_code = lang_code.split("-")[0].strip().lower()
             if base_code and base_code in languages_map:
-                country_languages.append(languages_map[base_code])
-        country.languages.set(country_languages)
+                wanted.add((country_id, languages_map[base_code]))
+
+    through = Country.languages.through
+    _sync_through_rows(
+        through,
+        through.objects.filter(country_id__in=scope),
+        ("country_id", "language_id"),
+        wanted,
+    )
 
 
-def _update_neighbors(country_neighbors_map):
-    """Update neighbor relationships for all countries."""
+def _update_neighbors(data, country_ids):
+    """Write the (symmetrical) neighbor relations of the parsed countries in bulk."""
     logger.info("Updating country neighbors...")
-    countries_by_code = {c.code2: c for c in Country.objects.all()}
+    wanted = set()
+    scope = set()
+    for item in data:
+        country_id = country_ids.get(item.code2)
+        if country_id is None or not item.neighbors:
+            continue
+        scope.add(country_id)
+        for neighbor_code in item.neighbors.split(","):
+            neighbor_id = country_ids.get(neighbor_code.strip())
+            if neighbor_id is not None:
+                wanted.add((country_id, neighbor_id))
+                wanted.add((neighbor_id, country_id))
+
+    through = Country.neighbors.through
+    _sync_through_rows(
+        through,
+        through.objects.filter(
+            models.Q(from_country_id__in=scope) | models.Q(to_country_id__in=scope)
+        ),
+        ("from_country_id", "to_country_id"),
+        wanted,
+    )
 
-    for country_code, neighbor_codes in country_neighbors_map.items():
-        country = countries_by_code.get(country_code)
-        if country:
-            neighbors = []
-            for neighbor_code in neighbor_codes:
-                neighbor_code = neighbor_code.strip()
-                if neighbor_code and neighbor_code in countries_by_code:
-                    neighbors.append(countries_by_code[neighbor_code])
-            country.neighbors.set(neighbors)
 
+def _sync_through_rows(through, current, fields, wanted):
+    """
+    Make the M2M rows in ``current`` match ``wanted``.
 
-def populate_regions():
-    """Populate Region model from geonames data."""
-    logger.info("Populating regions...")
-    data = parse_region_data()
+    Args:
+        through: The M2M through model.
+        current: Queryset of the through rows in scope.
+        fields: Names of the two foreign key columns.
+        wanted: Set of (left_id, right_id) pairs that should exist.
+    """
+    existing = {tuple(row[1:]): row[0] for row in current.values_list("id", *fields)}
 
-    countries = {c.code2: c for c in Country.objects.all()}
+    stale_ids = [row_id for pair, row_id in existing.items() if pair not in wanted]
+    if stale_ids:
+        through.objects.filter(id__in=stale_ids).delete()
 
-    # Load existing regions
-    existing = {r.geoname_id: r for r in Region.objects.all()}
+    new_rows = [through(**dict(zip(fields, pair))) for pair in sorted(wanted - set(existing))]
+    if new_rows:
+        through.objects.bulk_create(new_rows, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
 
-    to_create = []
-    to_update = []
 
+def populate_regions(countries=None):
+    """
+    Populate Region model from geonames data.
+
+    Incoming regions are compared with a projection of the stored values, and only
+    new or changed regions are written: with one native upsert on Django 4.1+ with
+    a backend that supports ``ON CONFLICT`` (see ``_supports_native_upsert``), and
+    with bulk creates and updates otherwise. Stored regions that are no longer in
+    the source are deactivated, and every region in the source is (re)activated:
+    ``is_active`` is owned by the sync, see ``REGION_UPDATE_FIELDS``.
+
+    Args:
+        countries: Only populate regions of these countries. Defaults to the
+            ``GEOBANK_COUNTRIES`` setting, or every country.
+
+    Returns:
+        bool: True if the data was populated, False if it could not be (the error is logged).
+    """
+    logger.info("Populating regions...")
+    data = parse_region_data(countries)
+    if not data:
+        logger.warning("No region data received, leaving regions unchanged.")
+        return False
+
+    country_ids = dict(Country.objects.values_list("code2", "id"))
+    scope = _get_country_scope(Region, countries)
+
+    rows = {}
     for item in data:
-        country = countries.get(item["country_code"])
-        if not country:
+        country_id = country_ids.get(item.country_code)
+        if country_id is None:
             continue
+        rows[item.geoname_id] = {
+            "name": item.name,
+            "code": item.region_code,
+            "name_ascii": item.name_ascii,
+            "country_id": country_id,
+            "is_active": True,
+        }
+
+    with transaction.atomic():
+        current = _get_current_values(Region, scope, REGION_UPDATE_FIELDS)
+        created, updated = _write_changed_rows(
+            Region, rows, current, REGION_UPDATE_FIELDS, batch_size=5000
+        )
+        deactivated = _deactivate_missing(Region, scope, set(rows))
+
+    logger.info(
+        f"Regions populated. Created: {created}, Updated: {updated}, "
+        f"Unchanged: {len(rows) - created - updated}, Deactivated: {deactivated}"
+    )
+    return True
+
+
+def populate_cities(population_gte: int = 15000, countries=None):
+    """
+    Populate City model from geonames data.
+
+    Cities are streamed from the parser and written in batches of
+    ``CITY_BATCH_SIZE``, so peak memory is set by the batch size rather than
+    the size of the dataset. Each batch is compared with a projection of the
+    stored values and only new or changed cities are written (see
+    ``populate_regions``). Stored cities at or above the population threshold
+    that are no longer in the source are deactivated, and every city in the
+    source is (re)activated.
+
+    The stage runs in one transaction: if the source cannot be read completely,
+    nothing is written. Rows go through ``get_fast_loader`` when it provides a
+    loader: COPY on PostgreSQL with ``GEOBANK_USE_COPY = True``, or fast-load
+    mode for an initial load on SQLite.
+
+    Args:
+        population_gte: Minimum population threshold for cities.
+        countries: Only populate cities of these countries. Defaults to the
+            ``GEOBANK_COUNTRIES`` setting, or every country.
+
+    Returns:
+        bool: True if the data was populated, False if it could not be (the error is logged).
+    """
+    logger.info("Populating cities...")
+
+    country_ids = dict(Country.objects.values_list("code2", "id"))
+    regions = {
+        f"{code2},{code}": region_id
+        for region_id, code2, code in Region.objects.values_list("id", "country__code2", "code")
+    }
+    scope = _get_country_scope(City, countries).filter(population__gte=population_gte)
 
-        geo_id = item["geoname_id"]
-        name = item["name"]
-        code = item["region_code"]
-        name_ascii = item["name_ascii"]
-
-        if geo_id in existing:
-            # Update existing region
-            obj = existing[geo_id]
-            obj.name = name
-            obj.code = code
-            obj.name_ascii = name_ascii
-            obj.country = country
-            to_update.append(obj)
-        else:
-            # Create a new region
-            to_create.append(
-                Region(
-                    geoname_id=geo_id,
-                    name=name,
-                    code=code,
-                    name_ascii=name_ascii,
-                    country=country,
+    loader = get_fast_loader(City)
+    created = updated = 0
+    seen = set()
+    try:
+        with loader.session() if loader else nullcontext(), transaction.atomic():
+            with (
+                loader.upsert(
+                    "geoname_id",
+                    CITY_UPDATE_FIELDS,
+                    follow=_get_followed_fields(City, CITY_UPDATE_FIELDS),
                 )
-            )
+                if loader
+                else nullcontext()
+            ) as staged:
+                for batch in _batched(
+                    iter_city_data(population_gte, countries=countries, strict=True),
+                    CITY_BATCH_SIZE,
+                ):
+                    rows = _build_city_rows(batch, country_ids, regions)
+                    current = _get_current_values(
+                        City, City.objects.filter(geoname_id__in=list(rows)), CITY_UPDATE_FIELDS
+                    )
+                    batch_created, batch_updated = _write_changed_rows(
+                        City,
+                        rows,
+                        current,
+                        CITY_UPDATE_FIELDS,
+                        batch_size=CITY_BATCH_SIZE,
+                        staged=staged,
+                    )
+                    created += batch_created
+                    updated += batch_updated
+                    seen.update(rows)
+
+            if seen:
+                deactivated = _deactivate_missing(City, scope, seen)
+    except Exception as e:
+        logger.error(f"Error populating cities: {e}")
+        return False
+
+    if not seen:
+        logger.warning("No city data received, leaving existing cities active.")
+        return False
+
+    logger.info(
+        f"Cities populated. Created: {created}, Updated: {updated}, "
+        f"Unchanged: {len(seen) - created - updated}, Deactivated: {deactivated}"
+    )
+    return True
 
-    # Bulk operations
-    if to_create:
-        Region.objects.bulk_create(to_create, batch_size=5000)
 
-    if to_update:
-        Region.objects.bulk_update(
-            to_update,
-            fields=["name", "code", "name_ascii", "country"],
-            batch_size=5000,
+def _supports_native_upsert(model):
+    """
+    Check whether rows of ``model`` can be upserted by the database on geoname_id.
+
+    This needs ``bulk_create(update_conflicts=True, unique_fields=...)`` (Django 4.1+)
+    and a backend that supports conflict targets, such as PostgreSQL or SQLite.
+    """
+    if django.VERSION < (4, 1):
+        return False
+    connection = connections[router.db_for_write(model)]
+    return connection.features.supports_update_conflicts_with_target
+
+
+def _native_upsert(model, objects, update_fields, batch_size):
+    """Insert ``objects``, updating ``update_fields`` of rows whose geoname_id already exists."""
+    if objects:
+        model.objects.bulk_create(
+            objects,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["geoname_id"],
+            update_fields=update_fields,
         )
 
-    logger.info(f"Regions populated. Created: {len(to_create)}, Updated: {len(to_update)}")
 
+def _get_country_scope(model, countries=None):
+    """Return the rows of ``model`` covered by the country allow-list."""
+    queryset = model.objects.exclude(geoname_id=None)
+    allowed_countries = get_allowed_countries(countries)
+    if allowed_countries is not None:
+        queryset = queryset.filter(country__code2__in=allowed_countries)
+    return queryset
 
-def populate_cities(population_gte: int = 15000):
-    logger.info("Populating cities...")
-    data = parse_city_data(population_gte)
 
-    countries = {c.code2: c for c in Country.objects.all()}
-    regions = {f"{r.country.code2},{r.code}": r for r in Region.objects.all()}
+def _get_current_values(model, queryset, fields):
+    """
+    Load a projection of the stored values of ``fields``, without building model instances.
 
-    # Fetch existing cities by geoname_id (NOT by PK)
-    existing = City.objects.in_bulk(field_name="geoname_id")
+    The untranslated columns are read (see ``_untranslated``), so that a
+    translated ``name`` does not make every row look changed. When ``fields``
+    includes ``name``, the active language's ``name_<lang>`` is read too (see
+    ``_get_followed_fields``).
 
-    new_objects = []
-    update_objects = []
+    Returns:
+        dict: geoname_id -> (pk, {attname: value}).
+    """
+    attnames = [model._meta.get_field(field).attname for field in fields]
+    name_field = _get_name_translation_field(model)
+    if name_field and "name" in attnames:
+        attnames.append(name_field)
+    return {
+        geoname_id: (pk, dict(zip(attnames, values)))
+        for geoname_id, pk, *values in _untranslated(queryset).values_list(
+            "geoname_id", "pk", *attnames
+        )
+    }
 
-    for item in data:
-        country = countries.get(item["country_code"])
-        region = regions.get(f"{item['country_code']},{item['region_code']}")
 
-        if not country:
+def _untranslated(queryset):
+    """
+    Return ``queryset`` without modeltranslation's field rewriting.
+
+    A ``MultilingualQuerySet`` reads and writes ``name`` as ``name_<active language>``.
+    The geonames data belongs in the original ``name`` column, and the translations
+    in ``name_<lang>`` must be neither compared with it nor overwritten by it.
+    """
+    if hasattr(queryset, "rewrite"):
+        return queryset.rewrite(False)
+    return queryset
+
+
+def _get_name_translation_field(model):
+    """Return the attname of ``name``'s translation in the active language, or None."""
+    from modeltranslation.utils import get_language
+
+    try:
+        return model._meta.get_field(f"name_{get_language()}").attname
+    except FieldDoesNotExist:
+        return None
+
+
+def _get_followed_fields(model, fields):
+    """
+    Map ``name``'s active-language translation to ``name``, if ``name`` is in ``fields``.
+
+    modeltranslation copies ``name`` into this field when a row is created, and
+    reads ``name`` through it. The copy follows ``name`` while it still mirrors
+    the stored value; a real translation (set by ``translate_data`` or by hand)
+    is never overwritten.
+
+    Returns:
+        dict: Translation attname -> ``"name"``, or an empty dict.
+    """
+    name_field = _get_name_translation_field(model)
+    if name_field and "name" in fields:
+        return {name_field: "name"}
+    return {}
+
+
+def _follows_name(stored, name_field):
+    """Check whether a stored ``name`` translation is still a copy of ``name``."""
+    return stored[name_field] in (None, "", stored["name"])
+
+
+def _write_changed_rows(model, rows, current, update_fields, batch_size, staged=None):
+    """
+    Write the rows that are new or differ from their stored values.
+
+    Args:
+        model: Region or City.
+        rows: Dict mapping geoname_id to a dict of field values, keyed by attname.
+        current: Stored values, as returned by ``_get_current_values``.
+        update_fields: Fields written on existing rows.
+        batch_size: Rows per statement.
+        staged: Optional staging area from a loader's ``upsert()``. If given, the
+            rows are written through it instead of the ORM.
+
+    Returns:
+        tuple: (created, updated) row counts.
+    """
+    decimal_places = {
+        field.attname: field.decimal_places
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.DecimalField)
+    }
+
+    def normalize(attname, value):
+        if value is not None and attname in decimal_places:
+            return round(float(value), decimal_places[attname])
+        return value
+
+    followed = list(_get_followed_fields(model, update_fields))
+
+    # New model instances get the name translation copied from ``name``. Changed
+    # rows are split by whether their stored translation should follow the new
+    # name (see ``_get_followed_fields``); the others leave it out of the update.
+    new_objects = []
+    following_objects = []
+    changed_objects = []
+    for geoname_id, values in rows.items():
+        stored = current.get(geoname_id)
+        if stored is None:
+            new_objects.append(model(geoname_id=geoname_id, **values))
             continue
 
-        try:
-            latitude = float(item["latitude"])
-            longitude = float(item["longitude"])
-        except (TypeError, ValueError):
-            latitude = longitude = None
-
-        geoname_id = item["geoname_id"]
-
-        if geoname_id in existing:
-            # UPDATE existing instance (which already includes correct PK)
-            obj = existing[geoname_id]
-            obj.name = item["name"]
-            obj.name_ascii = item["name_ascii"]
-            obj.latitude = latitude
-            obj.longitude = longitude
-            obj.country = country
-            obj.region = region
-            obj.population = item["population"]
-            obj.timezone = item["timezone"]
-
-            update_objects.append(obj)
-
-        else:
-            # CREATE new instance
-            new_objects.append(
-                City(
-                    geoname_id=geoname_id,
-                    name=item["name"],
-                    name_ascii=item["name_ascii"],
-                    latitude=latitude,
-                    longitude=longitude,
-                    country=country,
-                    region=region,
-                    population=item["population"],
-                    timezone=item["timezone"],
+        pk, stored_values = stored
+        follows = followed and _follows_name(stored_values, followed[0])
+        if any(
+            normalize(attname, value) != normalize(attname, stored_values[attname])
+            for attname, value in values.items()
+        ) or (follows and stored_values[followed[0]] != values["name"]):
+            obj = model(pk=pk, geoname_id=geoname_id, **values)
+            (following_objects if follows else changed_objects).append(obj)
+
+    if staged is not None:
+        staged.write(new_objects + following_objects + changed_objects)
+    elif _supports_native_upsert(model):
+        for obj in following_objects + changed_objects:
+            obj.pk = None
+        _native_upsert(model, new_objects + following_objects, update_fields + followed, batch_size)
+        _native_upsert(model, changed_objects, update_fields, batch_size)
+    else:
+        if new_objects:
+            model.objects.bulk_create(new_objects, batch_size=batch_size)
+        for objects, fields in (
+            (following_objects, update_fields + followed),
+            (changed_objects, update_fields),
+        ):
+            if objects:
+                _untranslated(model.objects.all()).bulk_update(
+                    objects, fields=fields, batch_size=batch_size
                 )
-            )
 
-    logger.info(f"Creating {len(new_objects)} new cities...")
-    logger.info(f"Updating {len(update_objects)} existing cities...")
+    return len(new_objects), len(following_objects) + len(changed_objects)
 
-    with transaction.atomic():
-        if new_objects:
-            City.objects.bulk_create(new_objects, batch_size=1000)
-
-        if update_objects:
-            City.objects.bulk_update(
-                update_objects,
-                fields=[
-                    "name",
-                    "name_ascii",
-                    "latitude",
-                    "longitude",
-                    "country",
-                    "region",
-                    "population",
-                    "timezone",
-                ],
-                batch_size=1000,
-            )
+
+def _deactivate_missing(model, scope, seen):
+    """
+    Set ``is_active=False`` on active rows in ``scope`` whose geoname_id is not in ``seen``.
+
+    Returns:
+        int: Number of deactivated rows.
+    """
+    stale_ids = [
+        pk
+        for pk, geoname_id in scope.filter(is_active=True).values_list("pk", "geoname_id")
+        if geoname_id not in seen
+    ]
+    for chunk in _batched(stale_ids, DEACTIVATE_BATCH_SIZE):
+        model.objects.filter(pk__in=chunk).update(is_active=False)
+    return len(stale_ids)
 
 
-def populate_flags():
-    """Populate flag URLs for countries from restcountries API."""
+def _batched(iterable, size):
+    """Yield lists of up to ``size`` items from an iterable."""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _build_city_rows(batch, country_ids, regions):
+    """
+    Turn a batch of parsed cities into City field values keyed by geoname_id.
+
+    Args:
+        batch: List of CityRecord tuples.
+        country_ids: Dict mapping country code2 to Country id.
+        regions: Dict mapping ``"<country_code>,<region_code>"`` to Region id.
+
+    Returns:
+        dict: geoname_id -> {attname: value}. Cities of unknown countries are skipped.
+    """
+    rows = {}
+    for item in batch:
+        country_id = country_ids.get(item.country_code)
+        if country_id is None:
+            continue
+
+        rows[item.geoname_id] = {
+            "name": item.name,
+            "name_ascii": item.name_ascii,
+            "latitude": item.latitude,
+            "longitude": item.longitude,
+            "country_id": country_id,
+            "region_id": regions.get(f"{item.country_code},{item.region_code}"),
+            "population": item.population,
+            "timezone": item.timezone,
+            "is_active": True,
+        }
+    return rows
+
+
+def populate_flags(restcountries_data=None):
+    """
+    Populate flag URLs for countries from restcountries API.
+
+    Only countries whose flag URLs differ from the stored ones are written, with
+    a single ``bulk_update``.
+
+    Args:
+        restcountries_data: Payload from ``load_restcountries_data``. Fetched when omitted.
+
+    Returns:
+        bool: True if the data was populated, False if it could not be (the error is logged).
+    """
     logger.info("Populating flags...")
 
-    flags_data = parse_flags_data()
+    flags_data = parse_flags_data(restcountries_data)
+    if not flags_data:
+        logger.warning("No flag data received, leaving flags unchanged.")
+        return False
 
-    countries = Country.objects.all()
-    for country in countries:
+    changed = []
+    skipped = 0
+    for country in Country.objects.only("id", "code2", "flag_png", "flag_svg"):
         country_flags = flags_data.get(country.code2)
-        if country_flags:
-            country.flag_png = country_flags.get("png")
-            country.flag_svg = country_flags.get("svg")
-            country.save(update_fields=["flag_png", "flag_svg"])
+        if not country_flags:
+            skipped += 1
+            continue
+
+        flag_png = country_flags.get("png")
+        flag_svg = country_flags.get("svg")
+        if (country.flag_png, country.flag_svg) == (flag_png, flag_svg):
+            skipped += 1
+            continue
 
+        country.flag_png = flag_png
+        country.flag_svg = flag_svg
+        changed.append(country)
 
-def translate_data(languages):
+    if changed:
+        Country.objects.bulk_update(changed, ["flag_png", "flag_svg"], batch_size=BULK_BATCH_SIZE)
+
+    logger.info(f"Flags populated. Changed: {len(changed)}, Skipped: {skipped}")
+    return True
+
+
+def translate_data(languages, countries=None):
     """
     Translate entity names using geobank translations data.
 
     Args:
         languages: List of language codes to translate.
+        countries: Only translate regions and cities of these countries. Defaults
+            to the ``GEOBANK_COUNTRIES`` setting, or every country.
+
+    Returns:
+        bool: True if the data was populated, False if it could not be (the error is logged).
     """
     logger.info("Starting translation...")
 
     # Map geoname_id to model instance
-    entities = _load_entities()
+    entities = _load_entities(languages, get_allowed_countries(countries))
     logger.info(f"Loaded {len(entities)} entities.")
 
     try:
-        logger.info(f"Downloading translations from {GEOBANK_TRANSLATIONS_URL}")
-        content = download_with_retry(GEOBANK_TRANSLATIONS_URL)
-
-        logger.info("Processing translations...")
-        translations = _parse_translations(content, entities, languages)
+        url = get_source_url("translations")
+        logger.info(f"Downloading translations from {url}")
+        with download_to_file(url) as content_file:
+            logger.info("Processing translations...")
+            translations = _parse_translations(content_file, entities, languages)
 
         logger.info("Applying translations...")
         modified_instances = _apply_translations(translations, entities)
@@ -352,21 +798,48 @@ def translate_data(languages):
 
     except Exception as e:
         logger.error(f"Error processing translations: {e}")
+        return False
+    return True
+
 
+def _load_entities(languages, countries=None):
+    """
+    Load all translatable entities into memory, limiting regions and cities to ``countries``.
 
-def _load_entities():
-    """Load all translatable entities into memory."""
+    Only the primary key, geoname_id and the ``name_{lang}`` fields of ``languages``
+    are loaded. ``_save_translations`` writes every ``name_{lang}`` field of each
+    modified entity, so those fields must not be deferred, or each read of an
+    untranslated one would query the database.
+    """
     logger.info("Loading entities into memory...")
+    regions = Region.objects.only(*_get_entity_fields(Region, languages))
+    cities = City.objects.only(*_get_entity_fields(City, languages))
+    if countries is not None:
+        regions = regions.filter(country__code2__in=countries)
+        cities = cities.filter(country__code2__in=countries)
+
     entities = {}
-    for country in Country.objects.all():
+    for country in Country.objects.only(*_get_entity_fields(Country, languages)):
         entities[country.geoname_id] = country
-    for region in Region.objects.all():
+    for region in regions:
         entities[region.geoname_id] = region
-    for city in City.objects.all():
+    for city in cities:
         entities[city.geoname_id] = city
     return entities
 
 
+def _get_entity_fields(model, languages):
+    """Return the fields ``_load_entities`` loads for ``model``, skipping missing languages."""
+    fields = ["id", "geoname_id"]
+    for lang in languages:
+        try:
+            fields.append(model._meta.get_field(f"name_{lang}").name)
+        except FieldDoesNotExist:
+            # Reported by _save_translations through _ensure_field
+            continue
+    return fields
+
+
 def _parse_translations(content, entities, languages):
     """Parse translations from the geobank translations zip file.
 
@@ -384,12 +857,17 @@ def _parse_translations(content, entities, languages):
         ...
     }
 
+    The files are decoded one entry at a time, and entries for unknown
+    geoname_ids or unwanted languages are dropped as soon as they are read, so
+    memory use is bounded by the translations kept rather than the file size.
+
     Args:
-        content: The raw bytes content of the zip file.
+        content: The zip file, as raw bytes or a seekable binary file object.
         entities: Dict mapping geoname_id to model instances.
         languages: List of language codes to include.
     """
-    import io
+    if isinstance(content, bytes):
+        content = io.BytesIO(content)
 
     translations = {}  # (geoname_id, lang) -> name
 
@@ -399,13 +877,11 @@ def _parse_translations(content, entities, languages):
         "city_translations.json",
     ]
 
-    with zipfile.ZipFile(io.BytesIO(content)) as z:
+    with zipfile.ZipFile(content) as z:
         for filename in translation_files:
             try:
                 with z.open(filename) as f:
-                    data = json.load(f)
-
-                    for geoname_id_str, lang_dict in data.items():
+                    for geoname_id_str, lang_dict in _iter_json_items(f):
                         try:
                             geoname_id = int(geoname_id_str)
                         except ValueError:
@@ -426,6 +902,88 @@ def _parse_translations(content, entities, languages):
     return translations
 
 
+def _iter_json_items(f, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Yield the members of a top-level JSON object one at a time.
+
+    Only the member being decoded is held in memory, together with at most one
+    chunk of unread text.
+
+    Args:
+        f: Binary file object holding a UTF-8 encoded JSON object.
+        chunk_size: Number of bytes to read at a time.
+
+    Yields:
+        tuple: (key, value) for each member, in file order.
+
+    Raises:
+        ValueError: If the content is not a JSON object.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + text_decoder.decode(chunk, final=eof)
+        pos = 0
+
+    def next_char():
+        """Skip whitespace and return the next character, without consuming it."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\n\r":
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                raise ValueError("Unexpected end of JSON data")
+            fill()
+
+    def decode_value():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A number cut at a chunk boundary still decodes ("1.5" as 1 from "1."),
+            # so the value is only complete when a delimiter follows it
+            if eof or (end < len(buffer) and buffer[end] in JSON_DELIMITERS):
+                pos = end
+                return value
+            fill()
+
+    if next_char() != "{":
+        raise ValueError("Expected a JSON object")
+    pos += 1
+    if next_char() == "}":
+        return
+
+    while True:
+        next_char()
+        key = decode_value()
+        if next_char() != ":":
+            raise ValueError(f"Expected ':' after key {key!r}")
+        pos += 1
+        next_char()
+        yield key, decode_value()
+
+        separator = next_char()
+        pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' after the value of {key!r}")
+
+
 def _apply_translations(translations, entities):
     """Apply translations to entities."""
     modified_instances = set()
@@ -433,7 +991,8 @@ def _apply_translations(translations, entities):
     for (geoname_id, lang), name in translations.items():
         instance = entities[geoname_id]
         field_name = f"name_{lang}"
-        if hasattr(instance, field_name):
+        # Checked on the class: reading a deferred field would query the database
+        if hasattr(type(instance), field_name):
             setattr(instance, field_name, name)
             modified_instances.add(instance)
 
@@ -441,7 +1000,12 @@ def _apply_translations(translations, entities):
 
 
 def _save_translations(modified_instances, languages):
-    """Save translated entities to database."""
+    """
+    Save translated entities to database.
+
+    City translations are written with a single COPY and ``UPDATE ... FROM`` when
+    ``get_copy_loader`` provides a loader, and in ``bulk_update`` batches otherwise.
+    """
     countries_to_update = []
     regions_to_update = []
     cities_to_update = []
@@ -466,6 +1030,10 @@ def _save_translations(modified_instances, languages):
     if regions_to_update:
         Region.objects.bulk_update(regions_to_update, update_fields)
     if cities_to_update:
+        loader = get_copy_loader(City)
+        if loader:
+            loader.update(cities_to_update, update_fields)
+            return
         for i in tqdm(range(0, len(cities_to_update), 1000), desc="Updating city batches"):
             City.objects.bulk_update(cities_to_update[i : i + 1000], update_fields)
 
@@ -0,0 +1,105 @@
+"""
+Snapshots of parsed source data, so unchanged sources are not parsed twice.
+
+With ``GEOBANK_SNAPSHOTS = True`` and a ``GEOBANK_CACHE_DIR``, the records a
+parser produces are pickled under ``<GEOBANK_CACHE_DIR>/snapshots``. The
+snapshot file name is derived from the SHA-256 of the raw source and the parser
+options, so a snapshot is only ever read back for byte-identical input.
+Snapshots are pickles: only point ``GEOBANK_CACHE_DIR`` at a directory that
+untrusted users cannot write to.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import os
+import pickle  # nosec B403
+from pathlib import Path
+
+from django.conf import settings
+
+from .downloaders import get_content_hash
+
+logger = logging.getLogger(__name__)
+
+# Bump when the parsed record types change, to invalidate older snapshots
+SNAPSHOT_VERSION = 1
+
+# Records pickled together; snapshots are written and read one batch at a time
+SNAPSHOT_BATCH_SIZE = 10000
+
+
+def iter_with_snapshot(name, url, params, parse):
+    """
+    Yield the parsed records of a source, from a snapshot when one is valid.
+
+    Without a valid snapshot, records come from ``parse()`` and are written to a
+    new snapshot as they are yielded. The snapshot is only kept if every record
+    was consumed.
+
+    Args:
+        name: Parser name, e.g. ``"cities"``.
+        url: URL of the source the records are parsed from. Its content must
+            already have been downloaded (or be a local file), so its hash is known.
+        params: JSON-serializable parser options that change the output.
+        parse: Callable returning an iterable of records.
+
+    Yields:
+        The parsed records.
+    """
+    path = _get_snapshot_path(name, url, params)
+    if path is None:
+        yield from parse()
+        return
+
+    if path.exists():
+        logger.info(f"Using parsed snapshot of {url}")
+        yield from _read_snapshot(path)
+        return
+
+    yield from _write_snapshot(path, parse())
+
+
+def _get_snapshot_path(name, url, params):
+    """Return the snapshot path for a parser run, or None if snapshots are unavailable."""
+    cache_dir = getattr(settings, "GEOBANK_CACHE_DIR", None)
+    if not getattr(settings, "GEOBANK_SNAPSHOTS", False) or not cache_dir:
+        return None
+
+    source_hash = get_content_hash(url)
+    if source_hash is None:
+        return None
+
+    key = hashlib.sha256(
+        json.dumps([SNAPSHOT_VERSION, name, source_hash, params]).encode("utf-8")
+    ).hexdigest()
+    snapshot_dir = Path(cache_dir) / "snapshots"
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    return snapshot_dir / f"{name}-{key}.pickle"
+
+
+def _read_snapshot(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)  # nosec B301 - written by _write_snapshot
+            except EOFError:
+                return
+            yield from batch
+
+
+def _write_snapshot(path, records):
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    complete = False
+    try:
+        with open(tmp_path, "wb") as f:
+            records = iter(records)
+            while batch := list(itertools.islice(records, SNAPSHOT_BATCH_SIZE)):
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield from batch
+        os.replace(tmp_path, path)
+        complete = True
+    finally:
+        if not complete:
+            tmp_path.unlink(missing_ok=True)
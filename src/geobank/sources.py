@@ -0,0 +1,170 @@
+"""
+Resolution of data source locations.
+
+Every source is downloaded from its upstream URL in ``constants.DATA_SOURCES``
+unless the project points it somewhere else:
+
+- ``GEOBANK_SOURCE_URLS``: a dict mapping source names to a URL, ``file://`` URL
+  or local path, for overriding individual sources.
+- ``GEOBANK_DATA_DIR``: a local directory holding a mirror of every source, as
+  written by the ``geobank_fetch`` management command.
+
+Any population threshold can be requested for the cities source. It is served
+from one of the files geonames publishes (``GEONAMES_CITIES_THRESHOLDS``) and
+filtered locally by the parser.
+"""
+
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+
+from .constants import DATA_SOURCES, GEONAMES_CITIES_THRESHOLDS
+from .downloaders import (
+    CHUNK_SIZE,
+    close_connections,
+    download_to_file,
+    is_available_locally,
+    prefetch,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_upstream_url(name: str, population_gte: int = 15000):
+    """
+    Return the original remote URL of a data source.
+
+    Args:
+        name: Source name, one of the keys of ``DATA_SOURCES``.
+        population_gte: Minimum population threshold, used by the cities source.
+    """
+    url, _ = DATA_SOURCES[name]
+    return url.format(population=population_gte)
+
+
+def get_mirror_filename(name: str, population_gte: int = 15000):
+    """Return the file name a data source has inside a local mirror directory."""
+    _, filename = DATA_SOURCES[name]
+    return filename.format(population=population_gte)
+
+
+def get_source_url(name: str, population_gte: int = 15000):
+    """
+    Return the URL a data source should be read from, honouring local overrides.
+
+    Args:
+        name: Source name, one of the keys of ``DATA_SOURCES``.
+        population_gte: Minimum population threshold, used by the cities source.
+            Any value is accepted; see ``get_city_file_threshold``.
+
+    Returns:
+        str: An ``http(s)://`` or ``file://`` URL.
+    """
+    if name == "cities":
+        population_gte = get_city_file_threshold(population_gte)
+
+    return _get_source_url(name, population_gte)
+
+
+def _get_source_url(name: str, population_gte: int):
+    """Resolve a source URL for a threshold geonames publishes a file for."""
+    overrides = getattr(settings, "GEOBANK_SOURCE_URLS", None) or {}
+    if name in overrides:
+        url = overrides[name].format(population=population_gte)
+        if "://" not in url:
+            url = Path(url).resolve().as_uri()
+        return url
+
+    data_dir = getattr(settings, "GEOBANK_DATA_DIR", None)
+    if data_dir:
+        return (Path(data_dir) / get_mirror_filename(name, population_gte)).resolve().as_uri()
+
+    return get_upstream_url(name, population_gte)
+
+
+def get_city_file_threshold(population_gte: int):
+    """
+    Pick the published cities file to serve a population threshold from.
+
+    Every file whose threshold is at most ``population_gte`` holds all the cities
+    needed. Among those, a file that can be read without downloading (local mirror
+    or download cache) is preferred, so one cached ``cities500`` serves every
+    threshold. Otherwise the smallest suitable file is downloaded.
+
+    Args:
+        population_gte: Requested minimum population.
+
+    Returns:
+        int: The threshold of the file to read, one of ``GEONAMES_CITIES_THRESHOLDS``.
+    """
+    candidates = [t for t in GEONAMES_CITIES_THRESHOLDS if t <= population_gte]
+    if not candidates:
+        logger.warning(
+            f"No cities file goes below {GEONAMES_CITIES_THRESHOLDS[0]} inhabitants, "
+            f"using cities{GEONAMES_CITIES_THRESHOLDS[0]} for population_gte={population_gte}"
+        )
+        return GEONAMES_CITIES_THRESHOLDS[0]
+
+    candidates.reverse()
+    for threshold in candidates:
+        if is_available_locally(_get_source_url("cities", threshold)):
+            return threshold
+    return candidates[0]
+
+
+def get_source_urls(population_gte: int = 15000):
+    """
+    Return every URL a full population run reads.
+
+    Args:
+        population_gte: Minimum population threshold for cities.
+
+    Returns:
+        list: Source URLs, in the order the population stages use them.
+    """
+    return [get_source_url(name, population_gte) for name in DATA_SOURCES]
+
+
+def mirror_sources(output_dir, population_gte_values=(15000,)):
+    """
+    Download every data source from upstream into a local mirror directory.
+
+    The directory can then be used as ``GEOBANK_DATA_DIR``, so population runs
+    read local files only. Files are replaced atomically, so an interrupted fetch
+    never leaves a truncated file in the mirror.
+
+    Args:
+        output_dir: Directory to write the mirror to. Created if missing.
+        population_gte_values: Population thresholds to fetch city files for.
+
+    Returns:
+        list: Paths of the files written.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    targets = {}
+    for name in DATA_SOURCES:
+        thresholds = population_gte_values if name == "cities" else population_gte_values[:1]
+        for population_gte in thresholds:
+            filename = get_mirror_filename(name, population_gte)
+            targets[filename] = get_upstream_url(name, population_gte)
+
+    written = []
+    try:
+        with prefetch(targets.values()):
+            for filename, url in targets.items():
+                path = output_dir / filename
+                tmp_path = path.with_name(f"{path.name}.tmp")
+                with download_to_file(url) as src, open(tmp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                os.replace(tmp_path, path)
+                logger.info(f"Saved {url} to {path}")
+                written.append(path)
+    finally:
+        close_connections()
+
+    return written
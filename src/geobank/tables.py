@@ -0,0 +1,142 @@
+"""
+Columnar, NumPy-backed representation of parsed city data.
+
+Requires the optional ``numpy`` dependency (``pip install geobank[numpy]``).
+"""
+
+import sys
+
+import numpy as np
+
+from .parsers import CityRecord
+
+# Population value stored for cities whose population is unknown
+MISSING_POPULATION = -1
+
+
+class CityTable:
+    """
+    Parsed cities stored column by column.
+
+    Numeric columns (``geoname_id``, ``latitude``, ``longitude``, ``population``) are
+    NumPy arrays; string columns (``name``, ``name_ascii``, ``country_code``,
+    ``region_code``, ``timezone``) are object arrays of interned strings. Unknown
+    coordinates are NaN and unknown populations are ``MISSING_POPULATION``.
+    """
+
+    NUMERIC_COLUMNS = ("geoname_id", "latitude", "longitude", "population")
+    STRING_COLUMNS = ("name", "name_ascii", "country_code", "region_code", "timezone")
+
+    def __init__(self, **columns):
+        for column in self.NUMERIC_COLUMNS + self.STRING_COLUMNS:
+            setattr(self, column, columns[column])
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a table from an iterable of CityRecord tuples.
+
+        Args:
+            records: Iterable of CityRecord, e.g. the output of ``iter_city_data``.
+
+        Returns:
+            CityTable: The table holding every record.
+        """
+        columns = {column: [] for column in CityRecord._fields}
+        for record in records:
+            for column, value in zip(CityRecord._fields, record):
+                columns[column].append(value)
+
+        return cls(
+            geoname_id=np.array(columns["geoname_id"], dtype=np.int64),
+            latitude=np.array(columns["latitude"], dtype=np.float64),
+            longitude=np.array(columns["longitude"], dtype=np.float64),
+            population=np.array(
+                [MISSING_POPULATION if p is None else p for p in columns["population"]],
+                dtype=np.int64,
+            ),
+            **{column: _intern_column(columns[column]) for column in cls.STRING_COLUMNS},
+        )
+
+    def __len__(self):
+        return len(self.geoname_id)
+
+    def __iter__(self):
+        """Yield the rows back as CityRecord tuples."""
+        for i in range(len(self)):
+            latitude = float(self.latitude[i])
+            longitude = float(self.longitude[i])
+            population = int(self.population[i])
+            yield CityRecord(
+                geoname_id=int(self.geoname_id[i]),
+                name=self.name[i],
+                name_ascii=self.name_ascii[i],
+                latitude=None if np.isnan(latitude) else latitude,
+                longitude=None if np.isnan(longitude) else longitude,
+                country_code=self.country_code[i],
+                region_code=self.region_code[i],
+                population=None if population == MISSING_POPULATION else population,
+                timezone=self.timezone[i],
+            )
+
+    def filter(self, mask):
+        """
+        Return a new table holding only the rows selected by ``mask``.
+
+        Args:
+            mask: Boolean array (or index array) over the rows of this table.
+
+        Returns:
+            CityTable: The selected rows.
+        """
+        return CityTable(
+            **{
+                column: getattr(self, column)[mask]
+                for column in self.NUMERIC_COLUMNS + self.STRING_COLUMNS
+            }
+        )
+
+    def population_gte(self, population_gte: int):
+        """Boolean mask of the cities with a known population of at least ``population_gte``."""
+        return self.population >= population_gte
+
+    def in_countries(self, country_codes):
+        """Boolean mask of the cities whose country code is in ``country_codes``."""
+        return np.isin(self.country_code, list(country_codes))
+
+    def valid_coordinates(self):
+        """Boolean mask of the cities with a latitude and longitude inside the valid range."""
+        with np.errstate(invalid="ignore"):
+            return (np.abs(self.latitude) <= 90) & (np.abs(self.longitude) <= 180)
+
+    def region_keys(self):
+        """Object array of ``"<country_code>,<region_code>"`` keys, as used for region lookups."""
+        keys = np.char.add(
+            np.char.add(self.country_code.astype(str), ","), self.region_code.astype(str)
+        )
+        return keys.astype(object)
+
+    @staticmethod
+    def resolve(keys, mapping):
+        """
+        Map each key through ``mapping``, looking up every distinct key only once.
+
+        Args:
+            keys: Array of keys, e.g. ``table.country_code`` or ``table.region_keys()``.
+            mapping: Dict from key to value (e.g. a model instance); missing keys map to None.
+
+        Returns:
+            numpy.ndarray: Object array of the mapped values, aligned with ``keys``.
+        """
+        if not len(keys):
+            return np.empty(0, dtype=object)
+        unique, inverse = np.unique(keys.astype(str), return_inverse=True)
+        values = np.array([mapping.get(key) for key in unique.tolist()], dtype=object)
+        return values[inverse]
+
+
+def _intern_column(values):
+    """Build an object array of interned strings, so repeated values share one object."""
+    column = np.empty(len(values), dtype=object)
+    column[:] = [sys.intern(v) if isinstance(v, str) else v for v in values]
+    return column
@@ -4,5 +4,5 @@ from .utils import populate_geobank_data
 
 
 @shared_task
-def populate_geobank_task(population_gte: int = 15000):
-    populate_geobank_data(population_gte)
+def populate_geobank_task(population_gte: int = 15000, force: bool = False, countries=None):
+    populate_geobank_data(population_gte, force, countries)
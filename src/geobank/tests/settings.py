@@ -12,6 +12,7 @@ DATABASES = {
 }
 
 INSTALLED_APPS = [
+    "modeltranslation",
     "django.contrib.contenttypes",
     "django.contrib.auth",
     "geobank",
@@ -21,6 +22,14 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 USE_TZ = True
 
+LANGUAGE_CODE = "en"
+
+LANGUAGES = [("en", "English"), ("de", "German")]
+
+# The translated name_<lang> columns depend on LANGUAGES, so they are not in the
+# shipped migrations; build the test tables straight from the models instead
+MIGRATION_MODULES = {"geobank": None}
+
 SECRET_KEY = "test-secret-key-for-geobank-tests"
 
 # Disable logging during tests
@@ -2,25 +2,59 @@
 Tests for the downloaders module.
 """
 
+import asyncio
+import hashlib
+import http.client
+import io
 import socket
-from unittest.mock import MagicMock, patch
-from urllib.error import URLError
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import AsyncMock, MagicMock, patch
+from urllib.error import HTTPError, URLError
 
 import pytest
+from django.test import override_settings
 
-from geobank.downloaders import download_with_retry
+from geobank.downloaders import (
+    ConnectionPool,
+    adownload_to_file,
+    adownload_with_retry,
+    aprefetch,
+    download_to_file,
+    download_with_retry,
+    get_content_hash,
+    is_available_locally,
+    prefetch,
+)
+
+
+def _mock_response(content, headers=None, status=200, fail_after=None):
+    stream = io.BytesIO(content)
+
+    def read(size=-1):
+        if fail_after is not None and stream.tell() >= fail_after:
+            raise ConnectionResetError("Connection reset by peer")
+        if fail_after is not None and size is not None and size >= 0:
+            size = min(size, fail_after - stream.tell())
+        return stream.read(size)
+
+    response = MagicMock()
+    response.read.side_effect = read
+    response.status = status
+    response.headers = headers or {}
+    response.__enter__ = MagicMock(return_value=response)
+    response.__exit__ = MagicMock(return_value=False)
+    return response
 
 
 class TestDownloadWithRetry:
     """Tests for download_with_retry function."""
 
-    @patch("geobank.downloaders.urllib.request.urlopen")
+    @patch("geobank.downloaders._urlopen")
     def test_successful_download(self, mock_urlopen):
         """Test successful download on first attempt."""
-        mock_response = MagicMock()
-        mock_response.read.return_value = b"test content"
-        mock_response.__enter__ = MagicMock(return_value=mock_response)
-        mock_response.__exit__ = MagicMock(return_value=False)
+        mock_response = _mock_response(b"test content")
         mock_urlopen.return_value = mock_response
 
         result = download_with_retry("http://example.com/test.txt")
@@ -29,13 +63,10 @@ class TestDownloadWithRetry:
         assert mock_urlopen.call_count == 1
 
     @patch("geobank.downloaders.time.sleep")
-    @patch("geobank.downloaders.urllib.request.urlopen")
+    @patch("geobank.downloaders._urlopen")
     def test_retry_on_url_error(self, mock_urlopen, mock_sleep):
         """Test retry mechanism on URLError."""
-        mock_response = MagicMock()
-        mock_response.read.return_value = b"success"
-        mock_response.__enter__ = MagicMock(return_value=mock_response)
-        mock_response.__exit__ = MagicMock(return_value=False)
+        mock_response = _mock_response(b"success")
 
         # Fail twice, succeed on third attempt
         mock_urlopen.side_effect = [
@@ -51,13 +82,10 @@ class TestDownloadWithRetry:
         assert mock_sleep.call_count == 2
 
     @patch("geobank.downloaders.time.sleep")
-    @patch("geobank.downloaders.urllib.request.urlopen")
+    @patch("geobank.downloaders._urlopen")
     def test_retry_on_socket_timeout(self, mock_urlopen, mock_sleep):
         """Test retry mechanism on socket timeout."""
-        mock_response = MagicMock()
-        mock_response.read.return_value = b"success"
-        mock_response.__enter__ = MagicMock(return_value=mock_response)
-        mock_response.__exit__ = MagicMock(return_value=False)
+        mock_response = _mock_response(b"success")
 
         mock_urlopen.side_effect = [
             socket.timeout("timed out"),
@@ -70,7 +98,7 @@ class TestDownloadWithRetry:
         assert mock_urlopen.call_count == 2
 
     @patch("geobank.downloaders.time.sleep")
-    @patch("geobank.downloaders.urllib.request.urlopen")
+    @patch("geobank.downloaders._urlopen")
     def test_raises_after_max_retries(self, mock_urlopen, mock_sleep):
         """Test that exception is raised after all retries are exhausted."""
         mock_urlopen.side_effect = URLError("Connection refused")
@@ -81,15 +109,446 @@ class TestDownloadWithRetry:
         assert mock_urlopen.call_count == 3
         assert mock_sleep.call_count == 2
 
-    @patch("geobank.downloaders.urllib.request.urlopen")
+    @patch("geobank.downloaders._urlopen")
     def test_custom_timeout(self, mock_urlopen):
         """Test that custom timeout is passed to urlopen."""
-        mock_response = MagicMock()
-        mock_response.read.return_value = b"test"
-        mock_response.__enter__ = MagicMock(return_value=mock_response)
-        mock_response.__exit__ = MagicMock(return_value=False)
+        mock_response = _mock_response(b"test")
         mock_urlopen.return_value = mock_response
 
         download_with_retry("http://example.com/test.txt", timeout=30)
 
-        mock_urlopen.assert_called_once_with("http://example.com/test.txt", timeout=30)
+        request = mock_urlopen.call_args.args[0]
+        assert request.full_url == "http://example.com/test.txt"
+        assert mock_urlopen.call_args.kwargs == {"timeout": 30}
+
+
+class TestDownloadCache:
+    """Tests for the conditional-GET download cache."""
+
+    @patch("geobank.downloaders._urlopen")
+    def test_no_conditional_headers_without_cache_dir(self, mock_urlopen):
+        """Test that no validators are sent when caching is disabled."""
+        mock_urlopen.return_value = _mock_response(b"data", {"ETag": '"abc"'})
+
+        download_with_retry("http://example.com/test.txt")
+
+        request = mock_urlopen.call_args.args[0]
+        assert request.get_header("If-none-match") is None
+
+    @patch("geobank.downloaders._urlopen")
+    def test_sends_validators_from_cached_response(self, mock_urlopen, tmp_path):
+        """Test that a cached response turns the next download into a conditional GET."""
+        headers = {"ETag": '"abc"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"}
+        mock_urlopen.return_value = _mock_response(b"data", headers)
+
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            download_with_retry("http://example.com/test.txt")
+            download_with_retry("http://example.com/test.txt")
+
+        first_request = mock_urlopen.call_args_list[0].args[0]
+        second_request = mock_urlopen.call_args_list[1].args[0]
+        assert first_request.get_header("If-none-match") is None
+        assert second_request.get_header("If-none-match") == '"abc"'
+        assert second_request.get_header("If-modified-since") == headers["Last-Modified"]
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_not_modified_served_from_cache(self, mock_urlopen, mock_sleep, tmp_path):
+        """Test that a 304 response returns the cached body without retrying."""
+        url = "http://example.com/test.txt"
+        mock_urlopen.side_effect = [
+            _mock_response(b"cached data", {"ETag": '"abc"'}),
+            HTTPError(url, 304, "Not Modified", {}, None),
+        ]
+
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            download_with_retry(url)
+            result = download_with_retry(url)
+
+        assert result == b"cached data"
+        assert mock_urlopen.call_count == 2
+        mock_sleep.assert_not_called()
+
+
+class TestDownloadToFile:
+    """Tests for download_to_file function."""
+
+    @patch("geobank.downloaders.CHUNK_SIZE", 4)
+    @patch("geobank.downloaders._urlopen")
+    def test_streams_response_in_chunks(self, mock_urlopen):
+        """Test that the response is copied in chunks into a seekable file."""
+        mock_response = _mock_response(b"0123456789")
+        mock_urlopen.return_value = mock_response
+
+        with download_to_file("http://example.com/test.zip") as f:
+            assert f.read() == b"0123456789"
+            f.seek(0)
+            assert f.read(4) == b"0123"
+
+        mock_response.read.assert_called_with(4)
+
+    @patch("geobank.downloaders._urlopen")
+    def test_returns_cached_file(self, mock_urlopen, tmp_path):
+        """Test that cached downloads are returned as files inside the cache directory."""
+        mock_urlopen.return_value = _mock_response(b"zip bytes")
+
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            with download_to_file("http://example.com/test.zip") as f:
+                assert f.read() == b"zip bytes"
+                assert f.name.startswith(str(tmp_path))
+
+
+class TestPrefetch:
+    """Tests for the prefetch context manager."""
+
+    @patch("geobank.downloaders._urlopen")
+    def test_prefetched_content_is_reused(self, mock_urlopen):
+        """Test that downloads inside the block use the prefetched content."""
+        mock_urlopen.side_effect = lambda request, timeout: _mock_response(
+            request.full_url.encode("utf-8")
+        )
+        urls = ["http://example.com/a.txt", "http://example.com/b.txt"]
+
+        with prefetch(urls):
+            assert mock_urlopen.call_count == 2
+            assert download_with_retry(urls[0]) == urls[0].encode("utf-8")
+            with download_to_file(urls[1]) as f:
+                assert f.read() == urls[1].encode("utf-8")
+
+        assert mock_urlopen.call_count == 2
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_failed_prefetch_downloads_on_demand(self, mock_urlopen, mock_sleep):
+        """Test that a URL that failed to prefetch is downloaded again when used."""
+        mock_urlopen.side_effect = [URLError("Connection refused"), _mock_response(b"late")]
+
+        with prefetch(["http://example.com/a.txt"], retries=1):
+            result = download_with_retry("http://example.com/a.txt")
+
+        assert result == b"late"
+        assert mock_urlopen.call_count == 2
+
+    @patch("geobank.downloaders._urlopen")
+    def test_unused_prefetched_files_are_discarded(self, mock_urlopen):
+        """Test that content prefetched but never used does not leak past the block."""
+        mock_urlopen.side_effect = lambda request, timeout: _mock_response(b"data")
+
+        with prefetch(["http://example.com/a.txt"]):
+            pass
+        download_with_retry("http://example.com/a.txt")
+
+        assert mock_urlopen.call_count == 2
+
+
+class TestResumableDownloads:
+    """Tests for resuming interrupted downloads with Range requests."""
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_resumes_after_connection_reset(self, mock_urlopen, mock_sleep):
+        """Test that a retry requests only the missing bytes."""
+        mock_urlopen.side_effect = [
+            _mock_response(b"0123456789", {"ETag": '"v1"', "Content-Length": "10"}, fail_after=4),
+            _mock_response(b"456789", {"Content-Range": "bytes 4-9/10"}, status=206),
+        ]
+
+        result = download_with_retry("http://example.com/big.zip")
+
+        assert result == b"0123456789"
+        retry_request = mock_urlopen.call_args_list[1].args[0]
+        assert retry_request.get_header("Range") == "bytes=4-"
+        assert retry_request.get_header("If-range") == '"v1"'
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_restarts_when_server_ignores_range(self, mock_urlopen, mock_sleep):
+        """Test that a full 200 response replaces the partial bytes."""
+        mock_urlopen.side_effect = [
+            _mock_response(b"0123456789", {"ETag": '"v1"', "Content-Length": "10"}, fail_after=4),
+            _mock_response(b"abcdefghij", {"ETag": '"v2"', "Content-Length": "10"}),
+        ]
+
+        result = download_with_retry("http://example.com/big.zip")
+
+        assert result == b"abcdefghij"
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_does_not_resume_without_validator(self, mock_urlopen, mock_sleep):
+        """Test that a partial download without ETag/Last-Modified starts over."""
+        mock_urlopen.side_effect = [
+            _mock_response(b"0123456789", {"Content-Length": "10"}, fail_after=4),
+            _mock_response(b"0123456789", {"Content-Length": "10"}),
+        ]
+
+        result = download_with_retry("http://example.com/big.zip")
+
+        assert result == b"0123456789"
+        assert mock_urlopen.call_args_list[1].args[0].get_header("Range") is None
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_short_body_is_retried(self, mock_urlopen, mock_sleep):
+        """Test that a body shorter than its Content-Length is not accepted."""
+        mock_urlopen.side_effect = [
+            _mock_response(b"01234", {"ETag": '"v1"', "Content-Length": "10"}),
+            _mock_response(b"56789", {"Content-Range": "bytes 5-9/10"}, status=206),
+        ]
+
+        result = download_with_retry("http://example.com/big.zip")
+
+        assert result == b"0123456789"
+        assert mock_urlopen.call_count == 2
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_partial_download_resumed_by_next_run(self, mock_urlopen, mock_sleep, tmp_path):
+        """Test that an interrupted cached download is resumed by a later call."""
+        url = "http://example.com/big.zip"
+        mock_urlopen.side_effect = [
+            _mock_response(b"0123456789", {"ETag": '"v1"', "Content-Length": "10"}, fail_after=6),
+            _mock_response(b"6789", {"Content-Range": "bytes 6-9/10"}, status=206),
+        ]
+
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            with pytest.raises(ConnectionResetError):
+                download_with_retry(url, retries=1)
+            result = download_with_retry(url, retries=1)
+
+        assert result == b"0123456789"
+        assert mock_urlopen.call_args_list[1].args[0].get_header("Range") == "bytes=6-"
+        assert not list(tmp_path.glob("*.part"))
+
+    @patch("geobank.downloaders._urlopen")
+    def test_damaged_cache_is_downloaded_again(self, mock_urlopen, tmp_path):
+        """Test that a cached body failing its checksum is not served on 304."""
+        url = "http://example.com/test.txt"
+        mock_urlopen.side_effect = [
+            _mock_response(b"good data", {"ETag": '"abc"'}),
+            HTTPError(url, 304, "Not Modified", {}, None),
+            _mock_response(b"good data", {"ETag": '"abc"'}),
+        ]
+
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            download_with_retry(url)
+            body_path = next(p for p in tmp_path.iterdir() if p.suffix == "")
+            body_path.write_bytes(b"bad data!")
+            result = download_with_retry(url)
+
+        assert result == b"good data"
+        assert mock_urlopen.call_args_list[2].args[0].get_header("If-none-match") is None
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/data")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.path.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestConnectionPool:
+    """Tests for the keep-alive ConnectionPool."""
+
+    def _get(self, pool, url):
+        with pool.urlopen(urllib.request.Request(url), timeout=5) as response:
+            return response.read()
+
+    def test_reuses_connection_for_same_host(self, http_server):
+        """Test that sequential requests to one host share a single connection."""
+        pool = ConnectionPool()
+
+        assert self._get(pool, f"{http_server}/a") == b"/a"
+        assert self._get(pool, f"{http_server}/b?x=1") == b"/b?x=1"
+        assert self._get(pool, f"{http_server}/c") == b"/c"
+
+        assert pool.opened == 1
+        assert pool.reused == 2
+        pool.close()
+        assert pool.opened == 0
+
+    def test_follows_redirects(self, http_server):
+        """Test that redirects are followed on the pooled connection."""
+        pool = ConnectionPool()
+
+        assert self._get(pool, f"{http_server}/redirect") == b"/data"
+        assert pool.opened == 1
+
+    def test_raises_http_error(self, http_server):
+        """Test that error statuses raise HTTPError like urllib does."""
+        pool = ConnectionPool()
+
+        with pytest.raises(HTTPError) as excinfo:
+            self._get(pool, f"{http_server}/missing")
+
+        assert excinfo.value.code == 404
+        assert self._get(pool, f"{http_server}/after") == b"/after"
+        assert pool.reused == 1
+
+    def test_wraps_connection_errors_in_url_error(self):
+        """Test that socket-level errors raise URLError like urllib does."""
+        pool = ConnectionPool()
+        error = socket.gaierror(-2, "Name or service not known")
+
+        with patch("http.client.HTTPConnection.request", side_effect=error):
+            with pytest.raises(URLError) as excinfo:
+                self._get(pool, "http://nonexistent.invalid/x")
+
+        assert excinfo.value.reason is error
+
+    @patch("geobank.downloaders.time.sleep")
+    def test_connection_errors_are_retried(self, mock_sleep, http_server):
+        """Test that downloads retry after a socket-level error from the pool."""
+        real_request = http.client.HTTPConnection.request
+        calls = []
+
+        def flaky_request(connection, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OSError(101, "Network is unreachable")
+            return real_request(connection, *args, **kwargs)
+
+        with patch("http.client.HTTPConnection.request", flaky_request):
+            assert download_with_retry(f"{http_server}/data", retries=3) == b"/data"
+
+        assert len(calls) == 2
+        mock_sleep.assert_called_once()
+
+
+class TestGetContentHash:
+    """Tests for get_content_hash function."""
+
+    @patch("geobank.downloaders._urlopen")
+    def test_hash_recorded_after_download(self, mock_urlopen):
+        """Test that completed downloads record the SHA-256 of their content."""
+        mock_urlopen.return_value = _mock_response(b"hash me")
+
+        download_with_retry("http://example.com/hashed.txt")
+
+        assert get_content_hash("http://example.com/hashed.txt") == (
+            hashlib.sha256(b"hash me").hexdigest()
+        )
+
+    def test_unknown_url(self):
+        """Test that URLs never downloaded have no hash."""
+        assert get_content_hash("http://example.com/never-downloaded.txt") is None
+
+    def test_file_url_hashed_on_demand(self, tmp_path):
+        """Test that local files are hashed without being downloaded first."""
+        path = tmp_path / "local.tsv"
+        path.write_bytes(b"local")
+
+        assert get_content_hash(path.as_uri()) == hashlib.sha256(b"local").hexdigest()
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders._urlopen")
+    def test_failed_prefetch_forgets_previous_hash(self, mock_urlopen, mock_sleep):
+        """Test that a source failing to prefetch does not report an earlier run's hash."""
+        url = "http://example.com/stale.txt"
+        mock_urlopen.return_value = _mock_response(b"first run")
+        download_with_retry(url)
+        assert get_content_hash(url) is not None
+
+        mock_urlopen.side_effect = URLError("Connection refused")
+        with prefetch([url], retries=1):
+            assert get_content_hash(url) is None
+
+
+class TestIsAvailableLocally:
+    """Tests for is_available_locally function."""
+
+    def test_file_url(self, tmp_path):
+        """Test that file:// URLs are available only if the file exists."""
+        path = tmp_path / "local.tsv"
+        assert not is_available_locally(path.as_uri())
+
+        path.write_bytes(b"local")
+        assert is_available_locally(path.as_uri())
+
+    @patch("geobank.downloaders._urlopen")
+    def test_cached_url(self, mock_urlopen, tmp_path):
+        """Test that remote URLs are available once they are in the download cache."""
+        mock_urlopen.return_value = _mock_response(b"cached")
+        url = "http://example.com/available.txt"
+
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            assert not is_available_locally(url)
+            download_with_retry(url)
+            assert is_available_locally(url)
+
+        assert not is_available_locally(url)
+
+
+class TestAsyncDownloads:
+    """Tests for the asyncio download API."""
+
+    @patch("geobank.downloaders.time.sleep")
+    @patch("geobank.downloaders.asyncio.sleep", new_callable=AsyncMock)
+    @patch("geobank.downloaders._urlopen")
+    def test_retries_with_asyncio_backoff(self, mock_urlopen, mock_async_sleep, mock_sleep):
+        """Test that retries wait with asyncio.sleep and exponential backoff."""
+        mock_urlopen.side_effect = [
+            URLError("Connection refused"),
+            socket.timeout("timed out"),
+            _mock_response(b"success"),
+        ]
+
+        result = asyncio.run(adownload_with_retry("http://example.com/test.txt", backoff=1))
+
+        assert result == b"success"
+        assert [c.args[0] for c in mock_async_sleep.call_args_list] == [1, 2]
+        mock_sleep.assert_not_called()
+
+    @patch("geobank.downloaders.asyncio.sleep", new_callable=AsyncMock)
+    @patch("geobank.downloaders._urlopen")
+    def test_raises_after_max_retries(self, mock_urlopen, mock_async_sleep):
+        """Test that the last error is raised once retries are exhausted."""
+        mock_urlopen.side_effect = URLError("Connection refused")
+
+        with pytest.raises(URLError):
+            asyncio.run(adownload_to_file("http://example.com/test.txt", retries=3))
+
+        assert mock_urlopen.call_count == 3
+
+    @patch("geobank.downloaders._urlopen")
+    def test_aprefetch_feeds_sync_downloads(self, mock_urlopen):
+        """Test that content prefetched asynchronously is used by the sync API."""
+        mock_urlopen.side_effect = lambda request, timeout: _mock_response(
+            request.full_url.encode("utf-8")
+        )
+        urls = ["http://example.com/a.txt", "http://example.com/b.txt"]
+
+        async def run():
+            async with aprefetch(urls, max_workers=1):
+                return download_with_retry(urls[0]), download_with_retry(urls[1])
+
+        assert asyncio.run(run()) == (urls[0].encode("utf-8"), urls[1].encode("utf-8"))
+        assert mock_urlopen.call_count == 2
@@ -113,13 +113,13 @@ class TestRealParsers(TestCase):
         assert len(data) >= 200, f"Expected at least 200 countries, got {len(data)}"
 
         # Find United States
-        us_data = next((c for c in data if c["code2"] == "US"), None)
+        us_data = next((c for c in data if c.code2 == "US"), None)
         assert us_data is not None, "United States not found in data"
-        assert us_data["code3"] == "USA"
-        assert us_data["name"] == "United States"
-        assert us_data["continent"] == "NA"
-        assert us_data["currency_code"] == "USD"
-        assert int(us_data["population"]) > 300000000
+        assert us_data.code3 == "USA"
+        assert us_data.name == "United States"
+        assert us_data.continent == "NA"
+        assert us_data.currency_code == "USD"
+        assert us_data.population > 300000000
 
     def test_parse_real_region_data(self):
         """Test parsing real region data."""
@@ -128,11 +128,9 @@ class TestRealParsers(TestCase):
         assert len(data) >= 1000, f"Expected at least 1000 regions, got {len(data)}"
 
         # Find California
-        ca_data = next(
-            (r for r in data if r["country_code"] == "US" and r["region_code"] == "CA"), None
-        )
+        ca_data = next((r for r in data if r.country_code == "US" and r.region_code == "CA"), None)
         assert ca_data is not None, "California not found in data"
-        assert "California" in ca_data["name"]
+        assert "California" in ca_data.name
 
     def test_parse_real_city_data(self):
         """Test parsing real city data."""
@@ -141,10 +139,10 @@ class TestRealParsers(TestCase):
         assert len(data) >= 10000, f"Expected at least 10000 cities, got {len(data)}"
 
         # Find New York City (geoname_id: 5128581)
-        nyc_data = next((c for c in data if c["geoname_id"] == 5128581), None)
+        nyc_data = next((c for c in data if c.geoname_id == 5128581), None)
         assert nyc_data is not None, "New York City not found in data"
-        assert "New York" in nyc_data["name"]
-        assert nyc_data["country_code"] == "US"
+        assert "New York" in nyc_data.name
+        assert nyc_data.country_code == "US"
 
     def test_parse_real_languages_data(self):
         """Test parsing real languages from restcountries API."""
@@ -0,0 +1,239 @@
+"""
+Tests for the loaders module.
+"""
+
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from geobank.loaders import (
+    CopyLoader,
+    SQLiteFastLoader,
+    copy_rows,
+    format_copy_value,
+    get_copy_loader,
+    get_fast_loader,
+)
+from geobank.models import City, Country
+from geobank.parsers import CityRecord
+from geobank.populators import populate_cities
+
+requires_postgresql = pytest.mark.skipif(
+    connection.vendor != "postgresql", reason="COPY needs PostgreSQL"
+)
+
+
+class TestGetCopyLoader:
+    """Tests for get_copy_loader function."""
+
+    def test_disabled_by_default(self):
+        """Test that no loader is returned without GEOBANK_USE_COPY."""
+        assert get_copy_loader(City) is None
+
+    @override_settings(GEOBANK_USE_COPY=True)
+    def test_falls_back_on_other_backends(self):
+        """Test that no loader is returned on backends other than PostgreSQL."""
+        if connection.vendor == "postgresql":
+            pytest.skip("Test database is PostgreSQL")
+        assert get_copy_loader(City) is None
+
+
+class TestFormatCopyValue:
+    """Tests for format_copy_value function."""
+
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            (None, "\\N"),
+            (True, "t"),
+            (False, "f"),
+            (42, "42"),
+            ("Saint-Étienne", "Saint-Étienne"),
+            ("a\tb\nc\rd\\e", "a\\tb\\nc\\rd\\\\e"),
+            (datetime.datetime(2024, 1, 2, 3, 4, 5), "2024-01-02T03:04:05"),
+        ],
+    )
+    def test_formats_values(self, value, expected):
+        """Test NULLs, booleans, dates and escaping of special characters."""
+        assert format_copy_value(value) == expected
+
+
+class TestCopyRows:
+    """Tests for copy_rows function."""
+
+    def test_psycopg2_copy_expert(self):
+        """Test that psycopg2 cursors receive one escaped text buffer."""
+        raw_cursor = MagicMock(spec=["copy_expert"])
+        cursor = MagicMock(cursor=raw_cursor)
+
+        copy_rows(cursor, "staging", ["id", "name"], [[1, "A\tB"], [2, None]], connection)
+
+        sql, buffer = raw_cursor.copy_expert.call_args[0]
+        assert sql.startswith("COPY ") and sql.endswith(" FROM STDIN")
+        assert buffer.read() == "1\tA\\tB\n2\t\\N\n"
+
+    def test_psycopg3_write_row(self):
+        """Test that psycopg 3 cursors receive the rows unformatted."""
+        raw_cursor = MagicMock(spec=["copy"])
+        copy = raw_cursor.copy.return_value.__enter__.return_value
+        cursor = MagicMock(cursor=raw_cursor)
+
+        copy_rows(cursor, "staging", ["id", "name"], [[1, "A"], [2, None]], connection)
+
+        assert [c.args[0] for c in copy.write_row.call_args_list] == [[1, "A"], [2, None]]
+
+
+class TestCopyLoaderStatements(TestCase):
+    """Tests for the SQL issued by CopyLoader, with a recording PostgreSQL stand-in."""
+
+    def _loader(self):
+        fake_connection = MagicMock(ops=connection.ops, alias="default")
+        cursor = fake_connection.cursor.return_value.__enter__.return_value
+        cursor.cursor = MagicMock(spec=["copy_expert"])
+        return CopyLoader(City, fake_connection), cursor
+
+    def test_upsert_orders_staged_rows(self):
+        """Test that staged rows carry an ordinal and the merge keeps the last one."""
+        loader, cursor = self._loader()
+        country = Country(pk=1, code2="US")
+
+        with loader.upsert("geoname_id", ["name"]) as staged:
+            staged.write([City(geoname_id=1, name="A", country=country)] * 2)
+            staged.write([City(geoname_id=1, name="B", country=country)])
+
+        statements = [c.args[0] for c in cursor.execute.call_args_list]
+        assert statements[0] == 'DROP TABLE IF EXISTS "pg_temp"."geobank_staging_geobank_city"'
+        assert '"geobank_ordinal" DESC' in statements[-1]
+        ordinals = [
+            line.split("\t")[-1]
+            for c in cursor.cursor.copy_expert.call_args_list
+            for line in c.args[1].read().splitlines()
+        ]
+        assert ordinals == ["0", "1", "2"]
+
+
+@requires_postgresql
+@override_settings(GEOBANK_USE_COPY=True)
+class TestCopyLoader(TestCase):
+    """Tests for CopyLoader against a PostgreSQL database."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.country = Country.objects.create(
+            code2="US", code3="USA", name="United States", geoname_id=6252001, continent="NA"
+        )
+
+    def test_upsert_inserts_and_updates(self):
+        """Test that staged rows are inserted or merged on geoname_id."""
+        City.objects.create(geoname_id=1, name="Old", population=1, country=self.country)
+        loader = get_copy_loader(City)
+
+        with loader.upsert("geoname_id", ["name", "population"]) as staged:
+            staged.write([City(geoname_id=1, name="New", population=2, country=self.country)])
+            staged.write(
+                [City(geoname_id=2, name="Other", name_ascii="Other", country=self.country)]
+            )
+
+        assert dict(City.objects.values_list("geoname_id", "name")) == {1: "New", 2: "Other"}
+        assert City.objects.get(geoname_id=2).slug == "other"
+
+    def test_upsert_keeps_last_staged_duplicate(self):
+        """Test that the row staged last wins when a geoname_id is staged twice."""
+        loader = get_copy_loader(City)
+
+        with loader.upsert("geoname_id", ["name"]) as staged:
+            staged.write([City(geoname_id=1, name="First", country=self.country)])
+            staged.write([City(geoname_id=1, name="Second", country=self.country)])
+            staged.write([City(geoname_id=1, name="Last", country=self.country)])
+
+        assert City.objects.get(geoname_id=1).name == "Last"
+
+    def test_update_writes_fields(self):
+        """Test that update() writes only the given fields of existing rows."""
+        city = City.objects.create(geoname_id=1, name="Old", population=1, country=self.country)
+        city.name = "New"
+        city.population = 2
+
+        get_copy_loader(City).update([city], ["name"])
+
+        city.refresh_from_db()
+        assert (city.name, city.population) == ("New", 1)
+
+
+class TestSQLiteFastLoader(TransactionTestCase):
+    """Tests for SQLite fast-load mode."""
+
+    def setUp(self):
+        """Set up test data."""
+        if connection.vendor != "sqlite":
+            self.skipTest("Fast-load mode needs SQLite")
+        self.country = Country.objects.create(
+            code2="US", code3="USA", name="United States", geoname_id=6252001, continent="NA"
+        )
+
+    def _pragmas(self):
+        with connection.cursor() as cursor:
+            values = {}
+            for name in SQLiteFastLoader.PRAGMAS:
+                cursor.execute(f"PRAGMA {name}")
+                values[name] = cursor.fetchone()[0]
+        return values
+
+    def test_only_for_empty_tables_outside_transactions(self):
+        """Test that fast-load mode is only used for an initial load."""
+        assert isinstance(get_fast_loader(City), SQLiteFastLoader)
+        with transaction.atomic():
+            assert get_fast_loader(City) is None
+        with override_settings(GEOBANK_SQLITE_FAST_LOAD=False):
+            assert get_fast_loader(City) is None
+
+        City.objects.create(geoname_id=1, name="City", country=self.country)
+        assert get_fast_loader(City) is None
+
+    @patch("django.db.backends.sqlite3.operations.DatabaseOperations.bulk_batch_size")
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities(self, mock_iter, mock_batch_size):
+        """Test that an initial city load inserts every row and restores the PRAGMAs."""
+        mock_batch_size.return_value = 2
+        mock_iter.return_value = iter(
+            [
+                CityRecord(i, f"City {i}", f"City {i}", 1.0, 2.0, "US", "", 1000, "UTC")
+                for i in range(1, 6)
+            ]
+            + [CityRecord(1, "City One", "City One", 1.0, 2.0, "US", "", 1000, "UTC")]
+        )
+        before = self._pragmas()
+
+        populate_cities(countries=["US"])
+
+        assert self._pragmas() == before
+        assert City.objects.count() == 5
+        city = City.objects.get(geoname_id=1)
+        assert (city.name, city.slug, city.is_active) == ("City One", "city-one", True)
+        assert city.country == self.country
+        assert city.created_at is not None
+
+    def test_upsert_keeps_translated_names(self):
+        """Test that a followed field is only overwritten while it copies its source."""
+        City.objects.create(geoname_id=1, name="München", country=self.country)
+        City.objects.create(geoname_id=2, name="Berlin", country=self.country)
+        City.objects.filter(geoname_id=1).update(name_en="Munich")
+        loader = SQLiteFastLoader(City, connection)
+
+        with transaction.atomic():
+            with loader.upsert("geoname_id", ["name"], follow={"name_en": "name"}) as rows:
+                rows.write(
+                    [
+                        City(geoname_id=1, name="Muenchen", country=self.country),
+                        City(geoname_id=2, name="Berlin Mitte", country=self.country),
+                    ]
+                )
+
+        names = City.objects.rewrite(False).order_by("geoname_id")
+        assert list(names.values_list("name", "name_en")) == [
+            ("Muenchen", "Munich"),
+            ("Berlin Mitte", "Berlin Mitte"),
+        ]
@@ -7,8 +7,15 @@ import json
 import zipfile
 from unittest.mock import patch
 
+from django.test import override_settings
+
+from geobank.constants import GEONAMES_CITIES_URL_TEMPLATE
 from geobank.parsers import (
+    CityRecord,
     _parse_calling_codes,
+    _split_lines,
+    iter_city_data,
+    load_restcountries_data,
     parse_city_data,
     parse_country_data,
     parse_currencies_data,
@@ -65,15 +72,15 @@ class TestParseCountryData:
         assert len(result) == 2
 
         us = result[0]
-        assert us["code2"] == "US"
-        assert us["code3"] == "USA"
-        assert us["name"] == "United States"
-        assert us["population"] == "331002651"
-        assert us["continent"] == "NA"
-        assert us["currency_code"] == "USD"
-        assert us["geoname_id"] == 6252001
-        assert us["neighbors"] == "CA,MX"
-        assert us["calling_codes"] == ["1"]
+        assert us.code2 == "US"
+        assert us.code3 == "USA"
+        assert us.name == "United States"
+        assert us.population == 331002651
+        assert us.continent == "NA"
+        assert us.currency_code == "USD"
+        assert us.geoname_id == 6252001
+        assert us.neighbors == "CA,MX"
+        assert us.calling_codes == ["1"]
 
     @patch("geobank.parsers.download_with_retry")
     def test_parse_country_data_skips_invalid_lines(self, mock_download):
@@ -88,7 +95,7 @@ class TestParseCountryData:
         result = parse_country_data()
 
         assert len(result) == 1
-        assert result[0]["code2"] == "US"
+        assert result[0].code2 == "US"
 
     @patch("geobank.parsers.download_with_retry")
     def test_parse_country_data_handles_error(self, mock_download):
@@ -114,11 +121,21 @@ class TestParseRegionData:
         assert len(result) == 2
 
         ca = result[0]
-        assert ca["country_code"] == "US"
-        assert ca["region_code"] == "CA"
-        assert ca["name"] == "California"
-        assert ca["name_ascii"] == "California"
-        assert ca["geoname_id"] == 5332921
+        assert ca.country_code == "US"
+        assert ca.region_code == "CA"
+        assert ca.name == "California"
+        assert ca.name_ascii == "California"
+        assert ca.geoname_id == 5332921
+
+    @patch("geobank.parsers.download_with_retry")
+    def test_parse_region_data_country_allow_list(self, mock_download):
+        """Test that regions of countries outside the allow-list are dropped."""
+        tsv_content = "US.CA\tCalifornia\tCalifornia\t5332921\nCA.08\tOntario\tOntario\t6093943\n"
+        mock_download.return_value = tsv_content.encode("utf-8")
+
+        assert [r.geoname_id for r in parse_region_data(countries=["ca"])] == [6093943]
+        with override_settings(GEOBANK_COUNTRIES=["US"]):
+            assert [r.geoname_id for r in parse_region_data()] == [5332921]
 
     @patch("geobank.parsers.download_with_retry")
     def test_parse_region_data_skips_invalid(self, mock_download):
@@ -137,7 +154,7 @@ class TestParseRegionData:
 class TestParseCityData:
     """Tests for parse_city_data function."""
 
-    @patch("geobank.parsers.download_with_retry")
+    @patch("geobank.parsers.download_to_file")
     def test_parse_city_data_success(self, mock_download):
         """Test successful parsing of city data from zip."""
         # Create a mock zip file with city data
@@ -149,20 +166,142 @@ class TestParseCityData:
         zip_buffer = io.BytesIO()
         with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
             zf.writestr("cities15000.txt", city_content)
-        mock_download.return_value = zip_buffer.getvalue()
+        zip_buffer.seek(0)
+        mock_download.return_value = zip_buffer
 
         result = parse_city_data(population_gte=15000)
 
         assert len(result) == 2
 
         nyc = result[0]
-        assert nyc["geoname_id"] == 5128581
-        assert nyc["name"] == "New York City"
-        assert nyc["name_ascii"] == "New York City"
-        assert nyc["country_code"] == "US"
-        assert nyc["region_code"] == "NY"
-        assert nyc["population"] == 8336817
-        assert nyc["timezone"] == "America/New_York"
+        assert nyc.geoname_id == 5128581
+        assert nyc.name == "New York City"
+        assert nyc.name_ascii == "New York City"
+        assert nyc.country_code == "US"
+        assert nyc.region_code == "NY"
+        assert nyc.population == 8336817
+        assert nyc.timezone == "America/New_York"
+        assert nyc.latitude == 40.71427
+        assert nyc.longitude == -74.00597
+
+    @patch("geobank.parsers.download_to_file")
+    def test_iter_city_data_is_lazy(self, mock_download):
+        """Test that cities are yielded one at a time from the zip member."""
+        city_content = "".join(
+            f"{geoname_id}\tCity {geoname_id}\tCity\t\t1.0\t2.0\tP\tPPL\tUS\t\tCA\t\t\t\t100\t\t1\tUTC\t2020-01-01\n"
+            for geoname_id in range(1, 4)
+        )
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("cities15000.txt", city_content)
+        zip_buffer.seek(0)
+        mock_download.return_value = zip_buffer
+
+        records = iter_city_data(population_gte=15000)
+
+        assert mock_download.call_count == 0
+        assert next(records).geoname_id == 1
+        assert [item.geoname_id for item in records] == [2, 3]
+
+    @patch("geobank.parsers.download_to_file")
+    def test_parse_city_data_invalid_coordinates(self, mock_download):
+        """Test that unparsable coordinates become None instead of dropping the city."""
+        city_content = "1\tCity\tCity\t\tn/a\t2.0\tP\tPPL\tUS\t\tCA\t\t\t\t\t\t1\tUTC\t2020-01-01\n"
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("cities15000.txt", city_content)
+        zip_buffer.seek(0)
+        mock_download.return_value = zip_buffer
+
+        result = parse_city_data(population_gte=15000)
+
+        assert result == [
+            CityRecord(
+                geoname_id=1,
+                name="City",
+                name_ascii="City",
+                latitude=None,
+                longitude=None,
+                country_code="US",
+                region_code="CA",
+                population=None,
+                timezone="UTC",
+            )
+        ]
+
+    @patch("geobank.parsers.download_to_file")
+    def test_parse_city_data_in_parallel(self, mock_download):
+        """Test that parsing with several processes returns the same records in order."""
+        city_content = "".join(
+            f"{geoname_id}\tCity {geoname_id}\tCity\t\t1.0\t2.0\tP\tPPL\tUS\t\tCA\t\t\t\t100\t\t1\tUTC\t2020-01-01\n"
+            for geoname_id in range(1, 51)
+        )
+
+        def make_zip():
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr("cities15000.txt", city_content)
+            zip_buffer.seek(0)
+            return zip_buffer
+
+        mock_download.side_effect = lambda url: make_zip()
+
+        serial = parse_city_data(population_gte=15000, workers=1)
+        parallel = parse_city_data(population_gte=15000, workers=2)
+
+        assert len(serial) == 50
+        assert parallel == serial
+
+    @patch("geobank.parsers.download_to_file")
+    def test_parse_city_data_arbitrary_threshold(self, mock_download):
+        """Test that thresholds without a published file are filtered from a larger one."""
+        city_content = (
+            "1\tSmall\tSmall\t\t1.0\t2.0\tP\tPPL\tUS\t\tCA\t\t\t\t20000\t\t1\tUTC\t2020-01-01\n"
+            "2\tLarge\tLarge\t\t1.0\t2.0\tP\tPPL\tUS\t\tCA\t\t\t\t60000\t\t1\tUTC\t2020-01-01\n"
+            "3\tCapital\tCapital\t\t1.0\t2.0\tP\tPPLC\tVA\t\t\t\t\t\t800\t\t1\tUTC\t2020-01-01\n"
+        )
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("cities15000.txt", city_content)
+        zip_buffer.seek(0)
+        mock_download.return_value = zip_buffer
+
+        result = parse_city_data(population_gte=50000)
+
+        mock_download.assert_called_once_with(GEONAMES_CITIES_URL_TEMPLATE.format(population=15000))
+        assert [city.geoname_id for city in result] == [2, 3]
+
+    @patch("geobank.parsers.download_to_file")
+    def test_parse_city_data_country_allow_list(self, mock_download):
+        """Test that cities of countries outside the allow-list are dropped while parsing."""
+        city_content = (
+            "1\tBoston\tBoston\t\t1.0\t2.0\tP\tPPL\tUS\t\tMA\t\t\t\t600000\t\t1\tUTC\t2020-01-01\n"
+            "2\tToronto\tToronto\t\t1.0\t2.0\tP\tPPL\tCA\t\t08\t\t\t\t2700000\t\t1\tUTC\t2020-01-01\n"
+        )
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("cities15000.txt", city_content)
+        zip_buffer.seek(0)
+        mock_download.return_value = zip_buffer
+
+        result = parse_city_data(population_gte=15000, countries=["CA"])
+
+        assert [city.name for city in result] == ["Toronto"]
+
+    def test_split_lines_aligns_on_newlines(self):
+        """Test that byte ranges cover the content and end on line boundaries."""
+        content = b"a\nbbbb\ncc\nd\n"
+
+        ranges = _split_lines(content, 3)
+
+        assert b"".join(content[start:end] for start, end in ranges) == content
+        assert all(content[end - 1 : end] == b"\n" for _, end in ranges)
+
+    def test_split_lines_without_trailing_newline(self):
+        """Test that the last range reaches the end of content without a final newline."""
+        content = b"aaaa\nbbbb"
+
+        assert _split_lines(content, 4) == [(0, 5), (5, 9)]
 
 
 class TestParseLanguagesData:
@@ -243,3 +382,34 @@ class TestParseFlagsData:
         assert len(result) == 2
         assert result["US"]["png"] == "https://example.com/us.png"
         assert result["CA"]["svg"] == "https://example.com/ca.svg"
+
+
+class TestLoadRestcountriesData:
+    """Tests for the shared restcountries payload."""
+
+    @patch("geobank.parsers.download_with_retry")
+    def test_one_fetch_serves_all_parsers(self, mock_download):
+        """Test that languages, currencies and flags are parsed from a single download."""
+        api_response = [
+            {
+                "cca2": "US",
+                "languages": {"eng": "English"},
+                "currencies": {"USD": {"name": "United States dollar", "symbol": "$"}},
+                "flags": {"png": "https://example.com/us.png"},
+            },
+        ]
+        mock_download.return_value = json.dumps(api_response).encode("utf-8")
+
+        data = load_restcountries_data()
+
+        assert parse_languages_data(data) == {"eng": "English"}
+        assert parse_currencies_data(data)["USD"]["symbol"] == "$"
+        assert parse_flags_data(data)["US"]["png"] == "https://example.com/us.png"
+        assert mock_download.call_count == 1
+
+    @patch("geobank.parsers.download_with_retry")
+    def test_handles_error(self, mock_download):
+        """Test that a failed download yields an empty payload."""
+        mock_download.side_effect = Exception("Network error")
+
+        assert load_restcountries_data() == []
@@ -7,7 +7,10 @@ import json
 import zipfile
 from unittest.mock import patch
 
-from django.test import TestCase
+import pytest
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from geobank.models import (
     City,
@@ -16,10 +19,15 @@ from geobank.models import (
     Language,
     Region,
 )
+from geobank.parsers import CityRecord, CountryRecord, RegionRecord
 from geobank.populators import (
+    CITY_UPDATE_FIELDS,
     _apply_translations,
     _build_languages_map,
+    _iter_json_items,
+    _load_entities,
     _parse_translations,
+    _save_translations,
     populate_cities,
     populate_countries,
     populate_currencies,
@@ -59,6 +67,25 @@ class TestPopulateLanguages(TestCase):
         eng = Language.objects.get(code="eng")
         assert eng.name == "English"
 
+    @patch("geobank.populators.parse_languages_data")
+    def test_populate_languages_query_count(self, mock_parse):
+        """Test that languages are written in bulk, skipping unchanged rows."""
+        Language.objects.create(code="eng", code2="en", name="Old English")
+        Language.objects.create(code="fra", code2="fr", name="French")
+        mock_parse.return_value = {
+            "eng": "English",
+            "fra": "French",
+            "spa": "Spanish",
+            "deu": "German",
+        }
+
+        # SELECT existing, one INSERT, one UPDATE (plus savepoint queries)
+        with self.assertNumQueries(5):
+            populate_languages()
+
+        assert Language.objects.get(code="eng").name == "English"
+        assert Language.objects.count() == 4
+
 
 class TestPopulateCurrencies(TestCase):
     """Tests for populate_currencies function."""
@@ -91,23 +118,24 @@ class TestPopulateCountries(TestCase):
     def test_populate_countries_creates_new(self, mock_parse):
         """Test that new countries are created."""
         mock_parse.return_value = [
-            {
-                "code2": "US",
-                "code3": "USA",
-                "fips": "US",
-                "name": "United States",
-                "name_ascii": "United States",
-                "population": "331000000",
-                "continent": "NA",
-                "tld": ".us",
-                "currency_code": "USD",
-                "calling_codes": ["1"],
-                "postal_code_format": "#####",
-                "postal_code_regex": "^\\d{5}$",
-                "languages": "en",
-                "geoname_id": 6252001,
-                "neighbors": "",
-            }
+            CountryRecord(
+                code2="US",
+                code3="USA",
+                fips="US",
+                name="United States",
+                name_ascii="United States",
+                population=331000000,
+                continent="NA",
+                tld=".us",
+                currency_code="USD",
+                currency_name="",
+                calling_codes=["1"],
+                postal_code_format="#####",
+                postal_code_regex="^\\d{5}$",
+                languages="en",
+                geoname_id=6252001,
+                neighbors="",
+            )
         ]
 
         populate_countries()
@@ -122,23 +150,24 @@ class TestPopulateCountries(TestCase):
     def test_populate_countries_with_calling_codes(self, mock_parse):
         """Test that calling codes are created."""
         mock_parse.return_value = [
-            {
-                "code2": "US",
-                "code3": "USA",
-                "fips": "US",
-                "name": "United States",
-                "name_ascii": "United States",
-                "population": "331000000",
-                "continent": "NA",
-                "tld": ".us",
-                "currency_code": "USD",
-                "calling_codes": ["1", "1809"],
-                "postal_code_format": "",
-                "postal_code_regex": "",
-                "languages": "",
-                "geoname_id": 6252001,
-                "neighbors": "",
-            }
+            CountryRecord(
+                code2="US",
+                code3="USA",
+                fips="US",
+                name="United States",
+                name_ascii="United States",
+                population=331000000,
+                continent="NA",
+                tld=".us",
+                currency_code="USD",
+                currency_name="",
+                calling_codes=["1", "1809"],
+                postal_code_format="",
+                postal_code_regex="",
+                languages="",
+                geoname_id=6252001,
+                neighbors="",
+            )
         ]
 
         populate_countries()
@@ -153,40 +182,42 @@ class TestPopulateCountries(TestCase):
         """Test that neighbor relationships are set up."""
         Currency.objects.create(code="CAD", name="Canadian Dollar", symbol="$")
         mock_parse.return_value = [
-            {
-                "code2": "US",
-                "code3": "USA",
-                "fips": "US",
-                "name": "United States",
-                "name_ascii": "United States",
-                "population": "331000000",
-                "continent": "NA",
-                "tld": ".us",
-                "currency_code": "USD",
-                "calling_codes": ["1"],
-                "postal_code_format": "",
-                "postal_code_regex": "",
-                "languages": "",
-                "geoname_id": 6252001,
-                "neighbors": "CA",
-            },
-            {
-                "code2": "CA",
-                "code3": "CAN",
-                "fips": "CA",
-                "name": "Canada",
-                "name_ascii": "Canada",
-                "population": "38000000",
-                "continent": "NA",
-                "tld": ".ca",
-                "currency_code": "CAD",
-                "calling_codes": ["1"],
-                "postal_code_format": "",
-                "postal_code_regex": "",
-                "languages": "",
-                "geoname_id": 6251999,
-                "neighbors": "US",
-            },
+            CountryRecord(
+                code2="US",
+                code3="USA",
+                fips="US",
+                name="United States",
+                name_ascii="United States",
+                population=331000000,
+                continent="NA",
+                tld=".us",
+                currency_code="USD",
+                currency_name="",
+                calling_codes=["1"],
+                postal_code_format="",
+                postal_code_regex="",
+                languages="",
+                geoname_id=6252001,
+                neighbors="CA",
+            ),
+            CountryRecord(
+                code2="CA",
+                code3="CAN",
+                fips="CA",
+                name="Canada",
+                name_ascii="Canada",
+                population=38000000,
+                continent="NA",
+                tld=".ca",
+                currency_code="CAD",
+                currency_name="",
+                calling_codes=["1"],
+                postal_code_format="",
+                postal_code_regex="",
+                languages="",
+                geoname_id=6251999,
+                neighbors="US",
+            ),
         ]
 
         populate_countries()
@@ -196,6 +227,140 @@ class TestPopulateCountries(TestCase):
         assert ca in us.neighbors.all()
         assert us in ca.neighbors.all()
 
+    @patch("geobank.populators.parse_country_data")
+    def test_populate_countries_syncs_related_rows(self, mock_parse):
+        """Test that a rerun replaces stale calling codes, languages and neighbors in bulk."""
+        Currency.objects.create(code="CAD", name="Canadian Dollar", symbol="$")
+        Currency.objects.create(code="MXN", name="Mexican Peso", symbol="$")
+        spanish = Language.objects.create(code="spa", code2="es", name="Spanish")
+
+        def records(us_codes, us_languages, us_neighbors):
+            base = {
+                "fips": "",
+                "tld": "",
+                "continent": "NA",
+                "currency_name": "",
+                "postal_code_format": "",
+                "postal_code_regex": "",
+                "population": 1,
+            }
+            return [
+                CountryRecord(
+                    code2="US",
+                    code3="USA",
+                    name="United States",
+                    name_ascii="United States",
+                    currency_code="USD",
+                    calling_codes=us_codes,
+                    languages=us_languages,
+                    geoname_id=6252001,
+                    neighbors=us_neighbors,
+                    **base,
+                ),
+                CountryRecord(
+                    code2="CA",
+                    code3="CAN",
+                    name="Canada",
+                    name_ascii="Canada",
+                    currency_code="CAD",
+                    calling_codes=["1"],
+                    languages="en-CA",
+                    geoname_id=6251999,
+                    neighbors="",
+                    **base,
+                ),
+                CountryRecord(
+                    code2="MX",
+                    code3="MEX",
+                    name="Mexico",
+                    name_ascii="Mexico",
+                    currency_code="MXN",
+                    calling_codes=["52"],
+                    languages="es-MX",
+                    geoname_id=3996063,
+                    neighbors="",
+                    **base,
+                ),
+            ]
+
+        mock_parse.return_value = records(["1", "1809"], "en-US,es-US", "CA")
+        populate_countries()
+        mock_parse.return_value = records(["1"], "en-US", "MX")
+        populate_countries()
+
+        us = Country.objects.get(code2="US")
+        assert list(us.calling_codes.values_list("code", flat=True)) == ["1"]
+        assert list(us.languages.all()) == [self.language]
+        assert set(us.neighbors.values_list("code2", flat=True)) == {"MX"}
+        assert not Country.objects.get(code2="CA").neighbors.exists()
+        assert list(Country.objects.get(code2="MX").languages.all()) == [spanish]
+        assert Country.objects.get(code2="MX").currency.code == "MXN"
+
+    @patch("geobank.populators.parse_country_data")
+    def test_populate_countries_unchanged_rerun_writes_nothing(self, mock_parse):
+        """Test that rerunning over unchanged data only reads."""
+        mock_parse.return_value = [
+            CountryRecord(
+                code2="US",
+                code3="USA",
+                fips="US",
+                name="United States",
+                name_ascii="United States",
+                population=331000000,
+                continent="NA",
+                tld=".us",
+                currency_code="USD",
+                currency_name="",
+                calling_codes=["1"],
+                postal_code_format="",
+                postal_code_regex="",
+                languages="en",
+                geoname_id=6252001,
+                neighbors="",
+            )
+        ]
+        populate_countries()
+
+        with CaptureQueriesContext(connection) as queries:
+            populate_countries()
+
+        statements = [q["sql"].split()[0] for q in queries.captured_queries]
+        assert not {"INSERT", "UPDATE", "DELETE"} & set(statements)
+
+    @patch("geobank.populators.parse_country_data")
+    def test_populate_countries_keeps_translated_names(self, mock_parse):
+        """Test that a translated name is neither compared nor overwritten."""
+        record = CountryRecord(
+            code2="DE",
+            code3="DEU",
+            fips="GM",
+            name="Deutschland",
+            name_ascii="Deutschland",
+            population=83000000,
+            continent="EU",
+            tld=".de",
+            currency_code="",
+            currency_name="",
+            calling_codes=[],
+            postal_code_format="",
+            postal_code_regex="",
+            languages="",
+            geoname_id=2921044,
+            neighbors="",
+        )
+        mock_parse.return_value = [record]
+        populate_countries()
+        Country.objects.filter(geoname_id=2921044).update(name_en="Germany")
+
+        with self.assertLogs("geobank.populators", "INFO") as logs:
+            populate_countries()
+        assert "Created: 0, Updated: 0" in "\n".join(logs.output)
+
+        mock_parse.return_value = [record._replace(name="Bundesrepublik Deutschland")]
+        populate_countries()
+        names = Country.objects.rewrite(False).values_list("name", "name_en")
+        assert list(names) == [("Bundesrepublik Deutschland", "Germany")]
+
 
 class TestPopulateRegions(TestCase):
     """Tests for populate_regions function."""
@@ -214,20 +379,20 @@ class TestPopulateRegions(TestCase):
     def test_populate_regions_creates_new(self, mock_parse):
         """Test that new regions are created."""
         mock_parse.return_value = [
-            {
-                "country_code": "US",
-                "region_code": "CA",
-                "name": "California",
-                "name_ascii": "California",
-                "geoname_id": 5332921,
-            },
-            {
-                "country_code": "US",
-                "region_code": "NY",
-                "name": "New York",
-                "name_ascii": "New York",
-                "geoname_id": 5128638,
-            },
+            RegionRecord(
+                country_code="US",
+                region_code="CA",
+                name="California",
+                name_ascii="California",
+                geoname_id=5332921,
+            ),
+            RegionRecord(
+                country_code="US",
+                region_code="NY",
+                name="New York",
+                name_ascii="New York",
+                geoname_id=5128638,
+            ),
         ]
 
         populate_regions()
@@ -248,13 +413,13 @@ class TestPopulateRegions(TestCase):
             country=self.country,
         )
         mock_parse.return_value = [
-            {
-                "country_code": "US",
-                "region_code": "CA",
-                "name": "California",
-                "name_ascii": "California",
-                "geoname_id": 5332921,
-            },
+            RegionRecord(
+                country_code="US",
+                region_code="CA",
+                name="California",
+                name_ascii="California",
+                geoname_id=5332921,
+            ),
         ]
 
         populate_regions()
@@ -263,6 +428,70 @@ class TestPopulateRegions(TestCase):
         ca = Region.objects.get(code="CA")
         assert ca.name == "California"
 
+    @patch("geobank.populators._supports_native_upsert", return_value=False)
+    @patch("geobank.populators.parse_region_data")
+    def test_populate_regions_without_native_upsert(self, mock_parse, mock_native):
+        """Test the create/update fallback used on Django < 4.1 or without ON CONFLICT."""
+        existing = Region.objects.create(
+            geoname_id=5332921, code="CA", name="Old California", country=self.country
+        )
+        mock_parse.return_value = [
+            RegionRecord("US", "CA", "California", "California", 5332921),
+            RegionRecord("US", "NY", "New York", "New York", 5128638),
+        ]
+
+        populate_regions()
+
+        assert Region.objects.count() == 2
+        assert Region.objects.get(pk=existing.pk).name == "California"
+
+    @patch("geobank.populators.parse_region_data")
+    def test_populate_regions_incremental_sync(self, mock_parse):
+        """Test that only changed regions are written and vanished ones are deactivated."""
+        mock_parse.return_value = [
+            RegionRecord("US", "CA", "California", "California", 5332921),
+            RegionRecord("US", "NY", "New York", "New York", 5128638),
+        ]
+        populate_regions()
+
+        with CaptureQueriesContext(connection) as queries:
+            populate_regions()
+        statements = {q["sql"].split()[0] for q in queries.captured_queries}
+        assert not {"INSERT", "UPDATE", "DELETE"} & statements
+
+        mock_parse.return_value = [
+            RegionRecord("US", "CA", "State of California", "California", 5332921),
+        ]
+        with self.assertLogs("geobank.populators", "INFO") as logs:
+            populate_regions()
+
+        assert "Created: 0, Updated: 1, Unchanged: 0, Deactivated: 1" in logs.output[-1]
+        assert not Region.objects.get(geoname_id=5128638).is_active
+
+        # A region that comes back is reactivated
+        mock_parse.return_value.append(RegionRecord("US", "NY", "New York", "New York", 5128638))
+        populate_regions()
+        assert Region.objects.get(geoname_id=5128638).is_active
+
+        # The sync owns is_active, so a region deactivated by hand is reactivated too
+        Region.objects.filter(geoname_id=5332921).update(is_active=False)
+        with self.assertLogs("geobank.populators", "INFO") as logs:
+            populate_regions()
+        assert "Created: 0, Updated: 1, Unchanged: 1, Deactivated: 0" in logs.output[-1]
+        assert Region.objects.get(geoname_id=5332921).is_active
+
+    @patch("geobank.populators.parse_region_data")
+    def test_populate_regions_empty_data_changes_nothing(self, mock_parse):
+        """Test that a failed fetch does not deactivate every region."""
+        Region.objects.create(
+            geoname_id=5332921, code="CA", name="California", country=self.country
+        )
+        mock_parse.return_value = []
+
+        assert populate_regions() is False
+
+        assert Region.objects.get(geoname_id=5332921).is_active
+
 
 class TestPopulateCities(TestCase):
     """Tests for populate_cities function."""
@@ -284,24 +513,24 @@ class TestPopulateCities(TestCase):
             country=self.country,
         )
 
-    @patch("geobank.populators.parse_city_data")
+    @patch("geobank.populators.iter_city_data")
     def test_populate_cities_creates_new(self, mock_parse):
         """Test that new cities are created."""
         mock_parse.return_value = [
-            {
-                "geoname_id": 5368361,
-                "name": "Los Angeles",
-                "name_ascii": "Los Angeles",
-                "latitude": "34.05223",
-                "longitude": "-118.24368",
-                "country_code": "US",
-                "region_code": "CA",
-                "population": 3979576,
-                "timezone": "America/Los_Angeles",
-            },
+            CityRecord(
+                geoname_id=5368361,
+                name="Los Angeles",
+                name_ascii="Los Angeles",
+                latitude=34.05223,
+                longitude=-118.24368,
+                country_code="US",
+                region_code="CA",
+                population=3979576,
+                timezone="America/Los_Angeles",
+            ),
         ]
 
-        populate_cities()
+        assert populate_cities() is True
 
         assert City.objects.count() == 1
         la = City.objects.get(geoname_id=5368361)
@@ -310,6 +539,184 @@ class TestPopulateCities(TestCase):
         assert la.region == self.region
         assert la.population == 3979576
 
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities_passes_country_allow_list(self, mock_iter):
+        """Test that the country allow-list reaches the parser unchanged."""
+        mock_iter.return_value = iter([])
+
+        populate_cities(5000, countries=["US"])
+
+        mock_iter.assert_called_once_with(5000, countries=["US"], strict=True)
+
+    @patch("geobank.populators.get_fast_loader")
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities_with_fast_loader(self, mock_iter, mock_loader):
+        """Test that changed cities are written through the fast loader when one is available."""
+        mock_iter.return_value = iter(
+            [
+                CityRecord(
+                    5368361, "Los Angeles", "Los Angeles", 34.0, -118.0, "US", "CA", 1, "UTC"
+                ),
+            ]
+        )
+        upsert = mock_loader.return_value.upsert
+        staged = upsert.return_value.__enter__.return_value
+
+        populate_cities()
+
+        upsert.assert_called_once_with("geoname_id", CITY_UPDATE_FIELDS, follow={"name_en": "name"})
+        (objects,) = staged.write.call_args[0]
+        assert [city.geoname_id for city in objects] == [5368361]
+        assert not City.objects.exists()
+
+    @patch("geobank.populators.CITY_BATCH_SIZE", 1)
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities_in_batches(self, mock_iter):
+        """Test that cities spread over several batches are created and updated."""
+        City.objects.create(
+            geoname_id=5391959,
+            name="Old San Francisco",
+            name_ascii="Old San Francisco",
+            country=self.country,
+        )
+        mock_iter.return_value = iter(
+            [
+                CityRecord(
+                    geoname_id=geoname_id,
+                    name=name,
+                    name_ascii=name,
+                    latitude=34.0,
+                    longitude=-118.0,
+                    country_code="US",
+                    region_code="CA",
+                    population=1000,
+                    timezone="America/Los_Angeles",
+                )
+                for geoname_id, name in [
+                    (5368361, "Los Angeles"),
+                    (5391959, "San Francisco"),
+                    (5391811, "San Diego"),
+                ]
+            ]
+        )
+
+        populate_cities()
+
+        assert City.objects.count() == 3
+        assert City.objects.get(geoname_id=5391959).name == "San Francisco"
+        assert City.objects.get(geoname_id=5391811).region == self.region
+
+    @patch("geobank.populators._supports_native_upsert", return_value=False)
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities_without_native_upsert(self, mock_iter, mock_native):
+        """Test the create/update fallback used on Django < 4.1 or without ON CONFLICT."""
+        existing = City.objects.create(
+            geoname_id=5391959, name="Old San Francisco", country=self.country
+        )
+        mock_iter.return_value = iter(
+            [
+                CityRecord(
+                    geoname_id=geoname_id,
+                    name=name,
+                    name_ascii=name,
+                    latitude=37.0,
+                    longitude=-122.0,
+                    country_code="US",
+                    region_code="CA",
+                    population=1000,
+                    timezone="America/Los_Angeles",
+                )
+                for geoname_id, name in [(5391959, "San Francisco"), (5391811, "San Diego")]
+            ]
+        )
+
+        populate_cities()
+
+        assert City.objects.count() == 2
+        assert City.objects.get(pk=existing.pk).name == "San Francisco"
+
+    def _city(self, geoname_id, name, population=100000, country_code="US"):
+        return CityRecord(
+            geoname_id=geoname_id,
+            name=name,
+            name_ascii=name,
+            latitude=34.052235,
+            longitude=-118.243683,
+            country_code=country_code,
+            region_code="CA",
+            population=population,
+            timezone="America/Los_Angeles",
+        )
+
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities_incremental_sync(self, mock_iter):
+        """Test that only changed cities are written and vanished ones are deactivated."""
+        canada = Country.objects.create(code2="CA", code3="CAN", name="Canada", geoname_id=6251999)
+        toronto = City.objects.create(geoname_id=6167865, name="Toronto", country=canada)
+        small = City.objects.create(
+            geoname_id=1, name="Small Town", country=self.country, population=100
+        )
+        cities = [self._city(5368361, "Los Angeles"), self._city(5391959, "San Francisco")]
+        mock_iter.side_effect = lambda *args, **kwargs: iter(cities)
+        populate_cities(15000, countries=["US"])
+
+        cities = [self._city(5368361, "Los Angeles", population=4000000)]
+        with self.assertLogs("geobank.populators", "INFO") as logs:
+            populate_cities(15000, countries=["US"])
+
+        assert "Created: 0, Updated: 1, Unchanged: 0, Deactivated: 1" in logs.output[-1]
+        assert City.objects.get(geoname_id=5368361).population == 4000000
+        assert not City.objects.get(geoname_id=5391959).is_active
+        # Outside the allow-list or below the threshold: left alone
+        assert City.objects.get(pk=toronto.pk).is_active
+        assert City.objects.get(pk=small.pk).is_active
+
+        with self.assertLogs("geobank.populators", "INFO") as logs:
+            populate_cities(15000, countries=["US"])
+        assert "Created: 0, Updated: 0, Unchanged: 1, Deactivated: 0" in logs.output[-1]
+
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities_keeps_translated_names(self, mock_iter):
+        """Test that translated names neither count as changes nor get overwritten."""
+        cities = [self._city(2867714, "München"), self._city(5368361, "Los Angeles")]
+        mock_iter.side_effect = lambda *args, **kwargs: iter(cities)
+        populate_cities()
+        City.objects.filter(geoname_id=2867714).update(name_en="Munich")
+
+        for native in (True, False):
+            with patch("geobank.populators._supports_native_upsert", return_value=native):
+                with self.assertLogs("geobank.populators", "INFO") as logs:
+                    populate_cities()
+            assert "Created: 0, Updated: 0, Unchanged: 2" in logs.output[-1]
+
+        # An upstream rename reaches the untranslated copy, but not the translation
+        cities = [self._city(2867714, "Muenchen"), self._city(5368361, "City of Los Angeles")]
+        populate_cities()
+
+        names = City.objects.rewrite(False).order_by("geoname_id")
+        assert list(names.values_list("name", "name_en")) == [
+            ("Muenchen", "Munich"),
+            ("City of Los Angeles", "City of Los Angeles"),
+        ]
+
+    @patch("geobank.populators.iter_city_data")
+    def test_populate_cities_parse_error_rolls_back(self, mock_iter):
+        """Test that a source failing mid-stream writes nothing and deactivates nothing."""
+        existing = City.objects.create(
+            geoname_id=5391959, name="San Francisco", country=self.country
+        )
+
+        def failing_iter(*args, **kwargs):
+            yield self._city(5368361, "Los Angeles")
+            raise OSError("truncated zip")
+
+        mock_iter.side_effect = failing_iter
+
+        assert populate_cities() is False
+
+        assert not City.objects.filter(geoname_id=5368361).exists()
+        assert City.objects.get(pk=existing.pk).is_active
+
 
 class TestPopulateFlags(TestCase):
     """Tests for populate_flags function."""
@@ -340,6 +747,26 @@ class TestPopulateFlags(TestCase):
         assert self.country.flag_png == "https://example.com/us.png"
         assert self.country.flag_svg == "https://example.com/us.svg"
 
+    @patch("geobank.populators.parse_flags_data")
+    def test_populate_flags_writes_only_changed(self, mock_parse):
+        """Test that unchanged flags are skipped and changed ones written in one query."""
+        self.country.flag_png = "https://example.com/us.png"
+        self.country.flag_svg = "https://example.com/us.svg"
+        self.country.save()
+        Country.objects.create(code2="CA", code3="CAN", name="Canada", geoname_id=6251999)
+        Country.objects.create(code2="MX", code3="MEX", name="Mexico", geoname_id=3996063)
+        mock_parse.return_value = {
+            "US": {"png": "https://example.com/us.png", "svg": "https://example.com/us.svg"},
+            "CA": {"png": "https://example.com/ca.png", "svg": "https://example.com/ca.svg"},
+        }
+
+        # SELECT countries, one UPDATE
+        with self.assertNumQueries(2), self.assertLogs("geobank.populators", "INFO") as logs:
+            populate_flags()
+
+        assert "Flags populated. Changed: 1, Skipped: 2" in logs.output[-1]
+        assert Country.objects.get(code2="CA").flag_svg == "https://example.com/ca.svg"
+
 
 class TestBuildLanguagesMap(TestCase):
     """Tests for _build_languages_map helper function."""
@@ -350,8 +777,8 @@ class TestBuildLanguagesMap(TestCase):
 
         result = _build_languages_map()
 
-        assert result["eng"] == lang
-        assert result["en"] == lang
+        assert result["eng"] == lang.id
+        assert result["en"] == lang.id
 
     def test_handles_missing_code2(self):
         """Test that languages without code2 are still included."""
@@ -359,7 +786,7 @@ class TestBuildLanguagesMap(TestCase):
 
         result = _build_languages_map()
 
-        assert result["qaa"] == lang
+        assert result["qaa"] == lang.id
         assert "" not in result
 
 
@@ -440,6 +867,49 @@ class TestParseTranslations(TestCase):
 
         assert len(result) == 0
 
+    def test_parse_translations_from_file_object(self):
+        """Test parsing translations from a seekable file instead of bytes."""
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("country_translations.json", json.dumps({"6252001": {"es": "EE. UU."}}))
+        zip_buffer.seek(0)
+
+        result = _parse_translations(zip_buffer, self.entities, ["es"])
+
+        assert result == {(6252001, "es"): "EE. UU."}
+
+
+class TestIterJsonItems:
+    """Tests for _iter_json_items function."""
+
+    DATA = {
+        "6252001": {"es": "Estados Unidos", "ja": "アメリカ合衆国"},
+        "1": {},
+        "2": {"n": 12345, "nested": [1, {"a": None}], "flag": True},
+        "3": 1.2345,
+        "4": -6.02e23,
+        "5": 12345,
+    }
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 7, 64 * 1024])
+    def test_matches_json_load(self, chunk_size):
+        """Test that members are decoded correctly whatever the chunk boundaries."""
+        content = json.dumps(self.DATA, ensure_ascii=False, indent=2).encode("utf-8")
+
+        items = list(_iter_json_items(io.BytesIO(content), chunk_size=chunk_size))
+
+        assert items == list(self.DATA.items())
+
+    def test_empty_object(self):
+        """Test that an empty object yields nothing."""
+        assert list(_iter_json_items(io.BytesIO(b" { } "), chunk_size=1)) == []
+
+    @pytest.mark.parametrize("content", [b"[1, 2]", b'{"a": 1', b'{"a" 1}', b'{"a": 1 "b": 2}'])
+    def test_invalid_json(self, content):
+        """Test that malformed content raises ValueError."""
+        with pytest.raises(ValueError):
+            list(_iter_json_items(io.BytesIO(content), chunk_size=2))
+
 
 class TestApplyTranslations(TestCase):
     """Tests for _apply_translations function."""
@@ -462,6 +932,50 @@ class TestApplyTranslations(TestCase):
 
         assert country in result
 
+    def test_apply_translations_to_loaded_entities_without_queries(self):
+        """Test that entities are loaded as projections and translated without queries."""
+        country = Country.objects.create(
+            code2="US", code3="USA", name="United States", geoname_id=6252001, continent="NA"
+        )
+        City.objects.create(geoname_id=5368361, name="Los Angeles", country=country)
+
+        entities = _load_entities(["es"])
+        city = entities[5368361]
+
+        assert "name" in city.get_deferred_fields()
+        with patch.object(City, "name_es", create=True), self.assertNumQueries(0):
+            result = _apply_translations({(5368361, "es"): "Los Ángeles"}, entities)
+        assert result == {city}
+
+    def test_save_translations_does_not_refetch_fields(self):
+        """Test that untranslated name fields of loaded entities are written without queries."""
+        # The test settings do not install modeltranslation, so ``name_ascii``
+        # stands in for a translated ``name_{lang}`` field (language "ascii").
+        country = Country.objects.create(
+            code2="US", code3="USA", name="United States", geoname_id=6252001, continent="NA"
+        )
+        for geoname_id in (1, 2, 3):
+            City.objects.create(
+                geoname_id=geoname_id, name="City", name_ascii="City", country=country
+            )
+
+        entities = _load_entities(["ascii"])
+        modified = _apply_translations({(1, "ascii"): "Translated"}, entities)
+        # Entities whose translation was not set are still written with their current value
+        modified.update(entities.values())
+
+        with CaptureQueriesContext(connection) as queries:
+            _save_translations(modified, ["ascii"])
+
+        statements = [q["sql"].split()[0] for q in queries]
+        assert "SELECT" not in statements
+        assert statements.count("UPDATE") == 2  # one bulk_update for countries, one for cities
+        assert dict(City.objects.values_list("geoname_id", "name_ascii")) == {
+            1: "Translated",
+            2: "City",
+            3: "City",
+        }
+
 
 class TestTranslateData(TestCase):
     """Tests for translate_data function."""
@@ -479,10 +993,10 @@ class TestTranslateData(TestCase):
     @patch("geobank.populators._save_translations")
     @patch("geobank.populators._apply_translations")
     @patch("geobank.populators._parse_translations")
-    @patch("geobank.populators.download_with_retry")
+    @patch("geobank.populators.download_to_file")
     def test_translate_data_workflow(self, mock_download, mock_parse, mock_apply, mock_save):
         """Test the complete translation workflow."""
-        mock_download.return_value = b"zip content"
+        mock_download.return_value = io.BytesIO(b"zip content")
         mock_parse.return_value = {(6252001, "es"): "Estados Unidos"}
         mock_apply.return_value = {self.country}
 
@@ -493,10 +1007,31 @@ class TestTranslateData(TestCase):
         mock_apply.assert_called_once()
         mock_save.assert_called_once()
 
-    @patch("geobank.populators.download_with_retry")
+    @patch("geobank.populators._save_translations")
+    @patch("geobank.populators._parse_translations")
+    @patch("geobank.populators.download_to_file")
+    def test_translate_data_country_allow_list(self, mock_download, mock_parse, mock_save):
+        """Test that only regions and cities of allowed countries are translated."""
+        canada = Country.objects.create(
+            code2="CA", code3="CAN", name="Canada", geoname_id=6251999, continent="NA"
+        )
+        Region.objects.create(
+            geoname_id=5332921, code="CA", name="California", country=self.country
+        )
+        Region.objects.create(geoname_id=6093943, code="08", name="Ontario", country=canada)
+        mock_download.return_value = io.BytesIO(b"zip content")
+        mock_parse.return_value = {}
+
+        with override_settings(GEOBANK_COUNTRIES=["US"]):
+            translate_data(["es"])
+
+        entities = mock_parse.call_args[0][1]
+        assert set(entities) == {6252001, 6251999, 5332921}
+
+    @patch("geobank.populators.download_to_file")
     def test_translate_data_handles_download_error(self, mock_download):
         """Test that download errors are handled gracefully."""
         mock_download.side_effect = Exception("Network error")
 
-        # Should not raise
-        translate_data(["es"])
+        # Should not raise, but report the failure
+        assert translate_data(["es"]) is False
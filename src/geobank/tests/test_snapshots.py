@@ -0,0 +1,99 @@
+"""
+Tests for the snapshots module.
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.test import override_settings
+
+from geobank.parsers import RegionRecord, parse_region_data
+from geobank.snapshots import iter_with_snapshot
+
+URL = "http://example.com/source.txt"
+
+
+@pytest.fixture
+def snapshot_settings(tmp_path):
+    with override_settings(GEOBANK_CACHE_DIR=str(tmp_path), GEOBANK_SNAPSHOTS=True):
+        with patch("geobank.snapshots.get_content_hash", return_value="a" * 64) as mock_hash:
+            yield mock_hash
+
+
+class TestIterWithSnapshot:
+    """Tests for iter_with_snapshot function."""
+
+    def test_disabled_by_default(self, tmp_path):
+        """Test that records are always parsed when snapshots are not enabled."""
+        parse = MagicMock(return_value=[1, 2])
+
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            assert list(iter_with_snapshot("test", URL, [], parse)) == [1, 2]
+            assert list(iter_with_snapshot("test", URL, [], parse)) == [1, 2]
+
+        assert parse.call_count == 2
+        assert not (tmp_path / "snapshots").exists()
+
+    @patch("geobank.snapshots.SNAPSHOT_BATCH_SIZE", 2)
+    def test_second_run_reads_snapshot(self, snapshot_settings):
+        """Test that an unchanged source is read back from its snapshot without parsing."""
+        parse = MagicMock(return_value=[("a", 1), ("b", 2), ("c", 3), ("d", 4), ("e", 5)])
+
+        first = list(iter_with_snapshot("test", URL, [15000], parse))
+        second = list(iter_with_snapshot("test", URL, [15000], parse))
+
+        assert second == first == parse.return_value
+        parse.assert_called_once()
+
+    def test_changed_source_or_params_reparse(self, snapshot_settings):
+        """Test that a different source hash or different options bypass the snapshot."""
+        parse = MagicMock(return_value=[1])
+
+        list(iter_with_snapshot("test", URL, [15000], parse))
+        list(iter_with_snapshot("test", URL, [5000], parse))
+        snapshot_settings.return_value = "b" * 64
+        list(iter_with_snapshot("test", URL, [15000], parse))
+
+        assert parse.call_count == 3
+
+    def test_unknown_hash_skips_snapshot(self, snapshot_settings):
+        """Test that sources without a known hash are parsed every time."""
+        snapshot_settings.return_value = None
+        parse = MagicMock(return_value=[1])
+
+        list(iter_with_snapshot("test", URL, [], parse))
+        list(iter_with_snapshot("test", URL, [], parse))
+
+        assert parse.call_count == 2
+
+    def test_incomplete_parse_leaves_no_snapshot(self, snapshot_settings, tmp_path):
+        """Test that a parse which fails or is not fully consumed is not saved."""
+
+        def failing_parse():
+            yield 1
+            raise ValueError("corrupt source")
+
+        with pytest.raises(ValueError):
+            list(iter_with_snapshot("test", URL, [], failing_parse))
+
+        records = iter_with_snapshot("test", URL, [], lambda: iter([1, 2, 3]))
+        next(records)
+        records.close()
+
+        assert list((tmp_path / "snapshots").iterdir()) == []
+
+
+class TestParserSnapshots:
+    """Tests for snapshots of parser output."""
+
+    @patch("geobank.parsers.download_with_retry")
+    def test_parse_region_data_uses_snapshot(self, mock_download, snapshot_settings):
+        """Test that region data is read from the snapshot for an unchanged source."""
+        mock_download.return_value = b"US.CA\tCalifornia\tCalifornia\t5332921\n"
+        first = parse_region_data()
+
+        # Same source hash, so the (different) downloaded text is not parsed again
+        mock_download.return_value = b"US.NY\tNew York\tNew York\t5128638\n"
+        second = parse_region_data()
+
+        assert first == second == [RegionRecord("US", "CA", "California", "California", 5332921)]
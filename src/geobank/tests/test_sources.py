@@ -0,0 +1,112 @@
+"""
+Tests for the sources module.
+"""
+
+import io
+from contextlib import nullcontext
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import override_settings
+
+from geobank.constants import GEONAMES_CITIES_URL_TEMPLATE, GEONAMES_COUNTRY_INFO_URL
+from geobank.downloaders import _get_cache_paths, download_with_retry
+from geobank.sources import (
+    get_city_file_threshold,
+    get_source_url,
+    get_source_urls,
+    mirror_sources,
+)
+
+
+class TestGetSourceUrl:
+    """Tests for get_source_url function."""
+
+    def test_defaults_to_upstream(self):
+        """Test that sources resolve to their upstream URLs without overrides."""
+        assert get_source_url("countries") == GEONAMES_COUNTRY_INFO_URL
+        assert get_source_url("cities", 5000) == GEONAMES_CITIES_URL_TEMPLATE.format(
+            population=5000
+        )
+
+    def test_data_dir(self, tmp_path):
+        """Test that GEOBANK_DATA_DIR points every source at the local mirror."""
+        with override_settings(GEOBANK_DATA_DIR=str(tmp_path)):
+            assert get_source_url("countries") == (tmp_path / "countryInfo.tsv").as_uri()
+            assert get_source_url("cities", 500) == (tmp_path / "cities500.zip").as_uri()
+            assert all(url.startswith("file://") for url in get_source_urls())
+
+    def test_per_source_override_wins(self, tmp_path):
+        """Test that GEOBANK_SOURCE_URLS takes precedence over GEOBANK_DATA_DIR."""
+        overrides = {
+            "regions": "https://mirror.example.com/regionInfo.tsv",
+            "cities": str(tmp_path / "my-cities{population}.zip"),
+        }
+        with override_settings(GEOBANK_DATA_DIR=str(tmp_path), GEOBANK_SOURCE_URLS=overrides):
+            assert get_source_url("regions") == "https://mirror.example.com/regionInfo.tsv"
+            assert get_source_url("cities", 1000) == (tmp_path / "my-cities1000.zip").as_uri()
+            assert get_source_url("countries") == (tmp_path / "countryInfo.tsv").as_uri()
+
+    def test_file_urls_are_read_locally(self, tmp_path):
+        """Test that mirrored sources are read from disk without any HTTP request."""
+        (tmp_path / "countryInfo.tsv").write_bytes(b"local data")
+
+        with override_settings(GEOBANK_DATA_DIR=str(tmp_path)):
+            with patch("geobank.downloaders._urlopen") as mock_urlopen:
+                assert download_with_retry(get_source_url("countries")) == b"local data"
+
+        mock_urlopen.assert_not_called()
+
+
+class TestGetCityFileThreshold:
+    """Tests for get_city_file_threshold function."""
+
+    def test_smallest_suitable_file(self):
+        """Test that the largest published threshold not above the request is used."""
+        assert get_city_file_threshold(15000) == 15000
+        assert get_city_file_threshold(50000) == 15000
+        assert get_city_file_threshold(7000) == 5000
+        assert get_source_url("cities", 50000) == GEONAMES_CITIES_URL_TEMPLATE.format(
+            population=15000
+        )
+
+    def test_below_smallest_file(self):
+        """Test that thresholds below every published file fall back to cities500."""
+        assert get_city_file_threshold(100) == 500
+
+    def test_prefers_local_superset(self, tmp_path):
+        """Test that an already available larger file is reused instead of downloading."""
+        (tmp_path / "cities500.zip").write_bytes(b"zip")
+
+        with override_settings(GEOBANK_DATA_DIR=str(tmp_path)):
+            assert get_city_file_threshold(50000) == 500
+            assert get_source_url("cities", 50000) == (tmp_path / "cities500.zip").as_uri()
+
+    def test_prefers_cached_superset(self, tmp_path):
+        """Test that a file in the download cache counts as available."""
+        url = GEONAMES_CITIES_URL_TEMPLATE.format(population=1000)
+        with override_settings(GEOBANK_CACHE_DIR=str(tmp_path)):
+            for path in _get_cache_paths(url):
+                path.write_bytes(b"{}")
+
+            assert get_city_file_threshold(5000) == 1000
+
+
+class TestMirrorSources:
+    """Tests for mirror_sources function."""
+
+    @patch("geobank.sources.prefetch", side_effect=lambda urls: nullcontext())
+    @patch("geobank.sources.download_to_file")
+    def test_writes_every_source(self, mock_download, mock_prefetch, tmp_path):
+        """Test that every source is written under its mirror file name."""
+        mock_download.side_effect = lambda url: io.BytesIO(url.encode("utf-8"))
+
+        written = mirror_sources(tmp_path, population_gte_values=(15000, 500))
+
+        names = {Path(path).name for path in written}
+        assert "countryInfo.tsv" in names
+        assert "translations.zip" in names
+        assert {"cities15000.zip", "cities500.zip"} <= names
+        assert "cities1000.zip" not in names
+        assert (tmp_path / "countryInfo.tsv").read_bytes() == GEONAMES_COUNTRY_INFO_URL.encode()
+        assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,95 @@
+"""
+Tests for the columnar city table.
+"""
+
+import io
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from geobank.parsers import CityRecord, parse_city_data  # noqa: E402
+from geobank.tables import MISSING_POPULATION, CityTable  # noqa: E402
+
+
+def _city(geoname_id, country_code="US", region_code="CA", population=1000, latitude=1.0):
+    return CityRecord(
+        geoname_id=geoname_id,
+        name=f"City {geoname_id}",
+        name_ascii=f"City {geoname_id}",
+        latitude=latitude,
+        longitude=2.0,
+        country_code=country_code,
+        region_code=region_code,
+        population=population,
+        timezone="UTC",
+    )
+
+
+class TestCityTable:
+    """Tests for CityTable."""
+
+    def test_from_records_round_trip(self):
+        """Test that records survive the trip through the columnar table."""
+        records = [_city(1), _city(2, population=None, latitude=None)]
+
+        table = CityTable.from_records(records)
+
+        assert len(table) == 2
+        assert table.geoname_id.dtype == np.int64
+        assert table.population.tolist() == [1000, MISSING_POPULATION]
+        assert np.isnan(table.latitude[1])
+        assert list(table) == [records[0], records[1]._replace(longitude=2.0)]
+
+    def test_string_columns_are_interned(self):
+        """Test that repeated strings share a single object."""
+        table = CityTable.from_records([_city(1), _city(2)])
+
+        assert table.country_code[0] is table.country_code[1]
+
+    def test_filters(self):
+        """Test population, country and coordinate masks."""
+        table = CityTable.from_records(
+            [
+                _city(1, population=500),
+                _city(2, country_code="CA", population=50000),
+                _city(3, population=20000, latitude=120.0),
+                _city(4, population=None),
+            ]
+        )
+
+        assert table.filter(table.population_gte(15000)).geoname_id.tolist() == [2, 3]
+        assert table.filter(table.in_countries({"CA"})).geoname_id.tolist() == [2]
+        assert table.filter(table.valid_coordinates()).geoname_id.tolist() == [1, 2, 4]
+
+    def test_resolve_region_keys(self):
+        """Test that FK keys are resolved through a lookup dict."""
+        table = CityTable.from_records([_city(1), _city(2, region_code="NY"), _city(3)])
+
+        resolved = CityTable.resolve(table.region_keys(), {"US,CA": "california"})
+
+        assert resolved.tolist() == ["california", None, "california"]
+
+
+class TestParseCityDataColumnar:
+    """Tests for parse_city_data(columnar=True)."""
+
+    @patch("geobank.parsers.download_to_file")
+    def test_returns_city_table(self, mock_download):
+        """Test that the columnar option returns a CityTable."""
+        city_content = (
+            "1\tCity\tCity\t\t1.5\t2.5\tP\tPPL\tUS\t\tCA\t\t\t\t100\t\t1\tUTC\t2020-01-01\n"
+        )
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("cities15000.txt", city_content)
+        zip_buffer.seek(0)
+        mock_download.return_value = zip_buffer
+
+        table = parse_city_data(population_gte=15000, columnar=True)
+
+        assert isinstance(table, CityTable)
+        assert table.geoname_id.tolist() == [1]
+        assert table.latitude.tolist() == [1.5]
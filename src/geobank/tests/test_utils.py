@@ -0,0 +1,156 @@
+"""
+Tests for the utils module.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from geobank.models import SourceFingerprint
+from geobank.sources import get_source_url
+from geobank.utils import apopulate_geobank_data, populate_geobank_data
+
+STAGE_FUNCTIONS = [
+    "populate_languages",
+    "populate_currencies",
+    "populate_countries",
+    "populate_regions",
+    "populate_cities",
+    "populate_flags",
+    "translate_data",
+]
+
+
+class TestPopulateGeobankDataFingerprints(TestCase):
+    """Tests for skipping population stages whose source data is unchanged."""
+
+    def setUp(self):
+        self.hashes = {}
+        self.mocks = {}
+        patchers = [
+            patch("geobank.utils.prefetch", side_effect=lambda urls: nullcontext()),
+            patch("geobank.utils.close_connections"),
+            patch("geobank.utils.load_restcountries_data", return_value=[]),
+            patch(
+                "geobank.utils.get_content_hash",
+                side_effect=lambda url: self.hashes.get(url, f"hash-of-{url}"),
+            ),
+        ]
+        for name in STAGE_FUNCTIONS:
+            patchers.append(patch(f"geobank.utils.{name}"))
+        for patcher in patchers:
+            mock = patcher.start()
+            self.addCleanup(patcher.stop)
+            self.mocks[patcher.attribute] = mock
+
+    def _called_stages(self):
+        called = [name for name in STAGE_FUNCTIONS if self.mocks[name].called]
+        for name in STAGE_FUNCTIONS:
+            self.mocks[name].reset_mock()
+        return called
+
+    def test_first_run_records_fingerprints(self):
+        """Test that every stage runs and records a fingerprint the first time."""
+        populate_geobank_data()
+
+        assert self._called_stages() == STAGE_FUNCTIONS
+        assert SourceFingerprint.objects.count() == len(STAGE_FUNCTIONS)
+
+    def test_unchanged_sources_skip_every_stage(self):
+        """Test that a second run over identical sources does no work."""
+        populate_geobank_data()
+        self._called_stages()
+
+        populate_geobank_data()
+
+        assert self._called_stages() == []
+        self.mocks["load_restcountries_data"].assert_called_once()
+
+    def test_force_runs_every_stage(self):
+        """Test that force bypasses the fingerprint check."""
+        populate_geobank_data()
+        self._called_stages()
+
+        populate_geobank_data(force=True)
+
+        assert self._called_stages() == STAGE_FUNCTIONS
+
+    def test_changed_source_reruns_dependent_stages(self):
+        """Test that a changed cities file reruns only the stages that read it."""
+        populate_geobank_data()
+        self._called_stages()
+
+        self.hashes[get_source_url("cities")] = "new-hash"
+        populate_geobank_data()
+
+        assert self._called_stages() == ["populate_cities", "translate_data"]
+
+    def test_changed_options_rerun_stage(self):
+        """Test that a different population threshold reruns the cities stage."""
+        populate_geobank_data(population_gte=15000)
+        self._called_stages()
+
+        self.hashes = {}
+        populate_geobank_data(population_gte=5000)
+
+        assert "populate_cities" in self._called_stages()
+
+    def test_changed_countries_rerun_country_scoped_stages(self):
+        """Test that a different country allow-list reruns regions, cities and translations."""
+        populate_geobank_data()
+        self._called_stages()
+
+        populate_geobank_data(countries=["us", "CA"])
+
+        self.mocks["populate_cities"].assert_called_once_with(15000, frozenset({"US", "CA"}))
+        assert self._called_stages() == ["populate_regions", "populate_cities", "translate_data"]
+
+    def test_unknown_hash_always_runs(self):
+        """Test that a stage whose source could not be hashed runs and is not recorded."""
+        self.mocks["get_content_hash"].side_effect = lambda url: None
+
+        populate_geobank_data()
+        populate_geobank_data()
+
+        assert self.mocks["populate_regions"].call_count == 2
+        assert SourceFingerprint.objects.count() == 0
+
+    def test_failed_stage_is_not_recorded(self):
+        """Test that a failed stage, and the stages that build on it, run again next time."""
+        self.mocks["populate_cities"].return_value = False
+
+        populate_geobank_data()
+
+        recorded = set(SourceFingerprint.objects.values_list("stage", flat=True))
+        assert recorded == {"languages", "currencies", "countries", "regions", "flags"}
+
+        self._called_stages()
+        self.mocks["populate_cities"].return_value = True
+        populate_geobank_data()
+
+        assert self._called_stages() == ["populate_cities", "translate_data"]
+        assert SourceFingerprint.objects.count() == len(STAGE_FUNCTIONS)
+
+
+class TestApopulateGeobankData:
+    """Tests for apopulate_geobank_data function."""
+
+    @patch("geobank.utils.populate_geobank_data")
+    @patch("geobank.utils.aprefetch")
+    def test_prefetches_then_populates(self, mock_aprefetch, mock_populate):
+        """Test that sources are prefetched asynchronously before the stages run."""
+        events = []
+
+        @asynccontextmanager
+        async def fake_aprefetch(urls):
+            events.append(("prefetch", len(urls)))
+            yield
+
+        mock_aprefetch.side_effect = fake_aprefetch
+        mock_populate.side_effect = lambda *args: events.append(("populate", args))
+
+        asyncio.run(apopulate_geobank_data(5000, True))
+
+        assert events == [("prefetch", 5), ("populate", (5000, True, None))]
@@ -5,13 +5,20 @@ This module provides the main entry point for populating the geobank database
 with geographic data from external sources (geonames.org, restcountries.com).
 """
 
+import functools
+import hashlib
+import json
 import logging
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.db.models import F, FloatField
 from django.db.models.functions import Power, Sqrt
 
-from .models import City
+from .constants import DATA_SOURCES
+from .downloaders import aprefetch, close_connections, get_content_hash, prefetch
+from .models import City, SourceFingerprint
+from .parsers import get_allowed_countries, load_restcountries_data
 from .populators import (
     populate_cities,
     populate_countries,
@@ -21,45 +28,156 @@ from .populators import (
     populate_regions,
     translate_data,
 )
+from .sources import get_source_url
 
 logger = logging.getLogger(__name__)
 
 
-def populate_geobank_data(population_gte: int = 15000):
+def populate_geobank_data(population_gte: int = 15000, force: bool = False, countries=None):
     """
     Populate all geobank data from external sources.
 
     This function orchestrates the entire data population process:
-    1. Populates reference data (languages, currencies)
-    2. Populates geographic data (countries, regions, cities)
-    3. Populates supplementary data (flags)
-    4. Applies translations based on configured languages
+    1. Downloads all data sources concurrently
+    2. Populates reference data (languages, currencies)
+    3. Populates geographic data (countries, regions, cities)
+    4. Populates supplementary data (flags)
+    5. Applies translations based on configured languages
+
+    A stage is skipped when the content of its sources (and its options) is
+    identical to the last run that completed it, so a refresh of unchanged
+    data does not rewrite every row.
 
     Args:
         population_gte: Minimum population threshold for cities.
                        Common values: 500, 1000, 5000, 15000
+        force: Run every stage, even when its source data is unchanged.
+        countries: Only populate regions and cities (and their translations) of
+            these ISO alpha-2 country codes. Defaults to the ``GEOBANK_COUNTRIES``
+            setting, or every country.
     """
     # Get configured languages for translation
     languages = [lang[0] for lang in getattr(settings, "LANGUAGES", [])]
     logger.info(f"Detected languages: {languages}")
 
-    # Populate reference data first (languages, currencies)
-    # These are needed before populating countries
-    populate_languages()
-    populate_currencies()
+    countries = get_allowed_countries(countries)
+    if countries is not None:
+        logger.info(f"Limiting regions and cities to: {', '.join(sorted(countries))}")
+    country_params = sorted(countries) if countries is not None else None
+
+    urls = {name: get_source_url(name, population_gte) for name in DATA_SOURCES}
+
+    # Languages, currencies and flags all come from one restcountries payload,
+    # loaded only if one of those stages actually runs
+    restcountries_data = functools.lru_cache(maxsize=None)(load_restcountries_data)
+
+    stages = [
+        # Populate reference data first (languages, currencies)
+        # These are needed before populating countries
+        ("languages", ["restcountries"], (), lambda: populate_languages(restcountries_data())),
+        ("currencies", ["restcountries"], (), lambda: populate_currencies(restcountries_data())),
+        # Populate geographic data
+        ("countries", ["restcountries", "countries"], (), populate_countries),
+        (
+            "regions",
+            ["countries", "regions"],
+            (country_params,),
+            lambda: populate_regions(countries),
+        ),
+        (
+            "cities",
+            ["countries", "regions", "cities"],
+            (population_gte, country_params),
+            lambda: populate_cities(population_gte, countries),
+        ),
+        # Populate supplementary data
+        ("flags", ["restcountries", "countries"], (), lambda: populate_flags(restcountries_data())),
+        # Apply translations
+        (
+            "translations",
+            ["countries", "regions", "cities", "translations"],
+            (population_gte, languages, country_params),
+            lambda: translate_data(languages, countries),
+        ),
+    ]
+
+    # A stage that reads every source of a failed stage builds on its data, so
+    # it may have run on incomplete data and is not recorded as done either
+    failed = []
+
+    # Download every source up front, in parallel, so the stages below only
+    # pay for parsing and database work
+    try:
+        with prefetch(urls.values()):
+            for stage, source_names, params, run in stages:
+                stage_urls = [urls[name] for name in source_names]
+                record = not any(sources <= set(source_names) for sources in failed)
+                if not _run_stage(stage, stage_urls, params, force, run, record):
+                    failed.append(set(source_names))
+    finally:
+        close_connections()
 
-    # Populate geographic data
-    populate_countries()
-    populate_regions()
-    populate_cities(population_gte)
+    logger.info("Geobank data population complete.")
 
-    # Populate supplementary data
-    populate_flags()
 
-    # Apply translations
-    translate_data(languages)
+async def apopulate_geobank_data(population_gte: int = 15000, force: bool = False, countries=None):
+    """
+    Asynchronous version of ``populate_geobank_data``.
 
-    logger.info("Geobank data population complete.")
+    All sources are downloaded concurrently on the event loop, with asyncio
+    retries and backoff, before the database stages run in a worker thread via
+    ``sync_to_async``. The stages are fed by the same parsers as the
+    synchronous version.
+
+    Args:
+        population_gte: Minimum population threshold for cities.
+        force: Run every stage, even when its source data is unchanged.
+        countries: Country allow-list, as for ``populate_geobank_data``.
+    """
+    urls = [get_source_url(name, population_gte) for name in DATA_SOURCES]
+    async with aprefetch(urls):
+        await sync_to_async(populate_geobank_data)(population_gte, force, countries)
+
+
+def _run_stage(stage, urls, params, force, run, record=True):
+    """
+    Run a population stage unless its inputs match the last completed run.
+
+    The stage's fingerprint is only stored when ``run()`` reports success and
+    ``record`` is true, so a failed stage runs again on the next call.
+
+    Returns:
+        bool: False if the stage ran and failed, True otherwise.
+    """
+    fingerprint = _get_stage_fingerprint(urls, params)
+    if (
+        not force
+        and fingerprint
+        and SourceFingerprint.objects.filter(stage=stage, fingerprint=fingerprint).exists()
+    ):
+        logger.info(f"Skipping {stage}: source data unchanged since the last run.")
+        return True
+
+    if not run():
+        logger.warning(f"{stage} did not complete and will run again next time.")
+        return False
+
+    # Sources that failed to prefetch are only downloaded by the stage itself
+    fingerprint = fingerprint or _get_stage_fingerprint(urls, params)
+    if fingerprint and record:
+        SourceFingerprint.objects.update_or_create(
+            stage=stage, defaults={"fingerprint": fingerprint}
+        )
+    return True
+
+
+def _get_stage_fingerprint(urls, params):
+    """Hash the content of a stage's sources and its options, or None if any is unknown."""
+    hashes = [get_content_hash(url) for url in urls]
+    if None in hashes:
+        return None
+    payload = json.dumps([hashes, list(params)], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 class LocationTypeChoices:
@@ -105,6 +223,7 @@ def get_location_by_coordinates(
 # Re-export individual functions for granular control
 __all__ = [
     "populate_geobank_data",
+    "apopulate_geobank_data",
     "populate_languages",
     "populate_currencies",
     "populate_countries",